@@ -0,0 +1,20 @@
+"""
+Read-through cache of FlatBlocks by slug, so pages and emails showing them don't query
+the database each time. Entries (including "no such block") last until any FlatBlock is
+saved or deleted, see main.signals.
+"""
+from flatblocks.models import FlatBlock
+from main.cache import VersionStamp, FLATBLOCKS
+
+# Cached for slugs without a FlatBlock, so looking them up again is free too
+_MISSING = "missing"
+
+
+def get(slug):
+    """ FlatBlock.objects.get(slug=slug), from the cache. Raises FlatBlock.DoesNotExist """
+    def build():
+        return FlatBlock.objects.filter(slug=slug).first() or _MISSING
+    block = VersionStamp(FLATBLOCKS).get_or_build("block:%s" % slug, build)
+    if block == _MISSING:
+        raise FlatBlock.DoesNotExist("No FlatBlock called %s" % slug)
+    return block
@@ -0,0 +1,138 @@
+"""
+Helpers for caching derived data across the site's worker processes.
+
+Each cached thing has a version stamp kept in the shared django cache. Changing the
+underlying data bumps the stamp, which invalidates the copy held by every process.
+"""
+from functools import wraps
+import hashlib
+import threading
+import uuid
+from django.core.cache import cache
+from django.db import connection
+
+DAY = 24 * 60 * 60
+# Version stamps for the pages cached by cache_anonymous_page(), see main.signals
+FLATBLOCKS = "main.flatblocks"
+COMMITTEE = "main.committee"
+
+
+class VersionStamp(object):
+    """
+    Opaque version of some data, shared between processes through the cache.
+    If the stamp is missing (evicted, or the cache is a DummyCache) a new one is issued
+    so anything keyed on it gets rebuilt rather than served stale.
+    """
+    def __init__(self, name):
+        self.key = "ucbc:version:%s" % name
+
+    def get(self):
+        if getattr(_local, 'pending', None):
+            bump_committed()
+        version = cache.get(self.key)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(self.key, version, None)
+            version = cache.get(self.key) or version
+        return version
+
+    def bump(self):
+        version = uuid.uuid4().hex
+        cache.set(self.key, version, None)
+        if connection.in_atomic_block:
+            # Until the transaction commits, other processes can rebuild from the old rows
+            # and cache the result under this version, so it's bumped again afterwards
+            _pending_bumps().add(self.key)
+        return version
+
+    def get_or_build(self, name, build, timeout=DAY):
+        """
+        Read-through shared cache of ``build()`` for the current version, so it's built
+        once between all the processes. ``build`` mustn't return None. If the stamp is
+        bumped while building (by ``build`` or anyone else) the value isn't stored, as it
+        may predate the change.
+        """
+        version = self.get()
+        key = "%s:%s:%s" % (self.key, version, name)
+        value = cache.get(key)
+        if value is None:
+            value = build()
+            if self.get() == version:
+                cache.set(key, value, timeout)
+        return value
+
+
+_local = threading.local()
+
+
+def _pending_bumps():
+    if not hasattr(_local, 'pending'):
+        _local.pending = set()
+    return _local.pending
+
+
+def bump_committed():
+    """
+    Bump the stamps bumped inside a transaction again, once it's over. Called after each
+    request by VersionStampMiddleware, and before this thread next reads a stamp.
+    """
+    if connection.in_atomic_block:
+        return
+    keys = list(_pending_bumps())
+    _local.pending = set()
+    for key in keys:
+        cache.set(key, uuid.uuid4().hex, None)
+
+
+class VersionedMemo(object):
+    """
+    Process local copy of the value returned by ``load``, reloaded whenever its version
+    stamp is bumped (by this or any other process).
+    """
+    def __init__(self, name, load):
+        self.stamp = VersionStamp(name)
+        self.load = load
+        self._cached = (None, None)
+
+    def get(self):
+        version = self.stamp.get()
+        cached_version, value = self._cached
+        if cached_version != version:
+            value = self.load()
+            self._cached = (version, value)
+        return value
+
+    def invalidate(self):
+        self._cached = (None, None)
+        self.stamp.bump()
+
+
+def cache_anonymous_page(*stamps, timeout=DAY):
+    """
+    View decorator caching the page served to anonymous GET requests, per path and
+    mobile/desktop variant (from minidetector), until any of the version ``stamps`` is
+    bumped. Requests with a query string aren't cached, so clients can't fill the cache
+    with variations of a URL, nor are responses that set cookies or use the CSRF token.
+    The X-Cache header reports whether the page came from the cache (HIT) or not (MISS).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.GET or request.user.is_authenticated():
+                return view(request, *args, **kwargs)
+            key = "ucbc:page:%s:%s:%s" % (
+                "mobile" if getattr(request, 'mobile', False) else "desktop",
+                ":".join(VersionStamp(stamp).get() for stamp in stamps),
+                hashlib.md5(request.path.encode('utf-8')).hexdigest())
+            response = cache.get(key)
+            if response is not None:
+                response['X-Cache'] = 'HIT'
+                return response
+            response = view(request, *args, **kwargs)
+            if (response.status_code == 200 and not response.streaming and not response.cookies
+                    and not request.META.get('CSRF_COOKIE_USED')):
+                cache.set(key, response, timeout)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,40 @@
+"""
+The committee roster shown on the committee page.
+
+The roster is built with one query and cached, gravatar URLs included, until the
+committee version stamp is bumped by a change to group membership, a member's account,
+role or Brewtoad account (see main.signals).
+"""
+from collections import namedtuple
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
+from gravatar.templatetags.gravatar import gravatar_for_user
+from main.cache import VersionStamp, COMMITTEE
+
+GROUP = "Committee"
+
+CommitteeMember = namedtuple('CommitteeMember', ('first_name', 'email', 'role', 'avatar_url', 'brewtoad_url'))
+
+
+def _related(user, name):
+    try:
+        return getattr(user, name)
+    except ObjectDoesNotExist:
+        return None
+
+
+def roster():
+    """ [CommitteeMember, ...] """
+    def build():
+        members = []
+        users = get_user_model().objects.filter(groups__name=GROUP).select_related('role', 'brewtoad_account')
+        for user in users:
+            role, brewtoad_account = _related(user, 'role'), _related(user, 'brewtoad_account')
+            members.append(CommitteeMember(
+                user.first_name,
+                user.email,
+                role.name if role else None,
+                gravatar_for_user(user),
+                brewtoad_account.url if brewtoad_account else None))
+        return members
+    return VersionStamp(COMMITTEE).get_or_build("roster", build)
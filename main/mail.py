@@ -0,0 +1,112 @@
+"""
+Email backend that keeps its SMTP connections open between messages.
+
+Every worker process holds at most one connection per set of credentials, so sending
+mail doesn't pay for a TCP + TLS handshake and a login every time.
+"""
+import os
+import smtplib
+import socket
+import threading
+import time
+from django.core.mail.backends.smtp import EmailBackend as SMTPEmailBackend
+
+
+class _Slot(object):
+    """ A pooled connection, and the lock that serialises its use """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.connection = None
+        self.pid = None
+        self.last_used = 0
+
+
+_slots = {}
+_slots_lock = threading.Lock()
+
+
+def _slot(key):
+    with _slots_lock:
+        return _slots.setdefault(key, _Slot())
+
+
+class PooledEmailBackend(SMTPEmailBackend):
+    """
+    SMTP backend sharing one connection per (host, port, credentials) in each process.
+    A connection that's been idle for longer than KEEPALIVE seconds is checked with a NOOP
+    before it's used, and one the server has dropped is reopened (and the message resent).
+    close() leaves the connection open for the next message.
+    """
+    KEEPALIVE = 60
+
+    def __init__(self, *args, **kwargs):
+        super(PooledEmailBackend, self).__init__(*args, **kwargs)
+        # send_messages() and open() apply fail_silently, the SMTPEmailBackend methods they
+        # use always raise so a dropped connection can be retried
+        self.quiet, self.fail_silently = self.fail_silently, False
+        self._slot = _slot((self.host, self.port, self.username, self.password, self.use_tls,
+                            getattr(self, 'use_ssl', False)))
+
+    def open(self):
+        with self._slot.lock:
+            try:
+                self._attach()
+            except Exception:
+                if not self.quiet:
+                    raise
+        return False
+
+    def close(self):
+        self.connection = None
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return
+        sent = 0
+        with self._slot.lock:
+            for message in email_messages:
+                try:
+                    if self._send_reconnecting(message):
+                        sent += 1
+                except Exception:
+                    if not self.quiet:
+                        raise
+        return sent
+
+    def _send_reconnecting(self, message):
+        self._attach()
+        try:
+            sent = self._send(message)
+        except (smtplib.SMTPServerDisconnected, socket.error):
+            self._discard()
+            self._attach()
+            sent = self._send(message)
+        self._slot.last_used = time.time()
+        return sent
+
+    def _attach(self):
+        """ Point self.connection at the pooled connection, (re)connecting as needed """
+        slot = self._slot
+        if slot.connection is not None and slot.pid != os.getpid():
+            # Inherited from the parent process, which is still using it
+            slot.connection = None
+        if slot.connection is not None and time.time() - slot.last_used > self.KEEPALIVE:
+            try:
+                alive = slot.connection.noop()[0] == 250
+            except (smtplib.SMTPException, socket.error):
+                alive = False
+            if not alive:
+                self._discard()
+        if slot.connection is None:
+            self.connection = None
+            super(PooledEmailBackend, self).open()
+            slot.connection, slot.pid, slot.last_used = self.connection, os.getpid(), time.time()
+        self.connection = slot.connection
+
+    def _discard(self):
+        try:
+            self._slot.connection.quit()
+        except (smtplib.SMTPException, socket.error):
+            pass
+        self._slot.connection = None
+        self.connection = None
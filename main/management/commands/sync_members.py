@@ -0,0 +1,44 @@
+import multiprocessing
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from main.members import MembershipSync, read_members, send_all
+
+
+class Command(BaseCommand):
+    args = "<signup sheet csv>"
+    help = ("Create accounts for the new members on a signup sheet and email them their password, "
+            "and deactivate the accounts of members who aren't on it")
+    option_list = BaseCommand.option_list + (
+        make_option('--no-email',
+                    action='store_false',
+                    dest='email',
+                    default=True,
+                    help="Print the welcome emails instead of sending them"),
+        make_option('--workers',
+                    type='int',
+                    dest='workers',
+                    default=multiprocessing.cpu_count(),
+                    help="Processes to hash the new members' passwords with, defaults to one per CPU"),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Usage: sync_members %s" % self.args)
+        with open(args[0], 'r') as csv_file:
+            members = read_members(csv_file)
+        sync = MembershipSync(members, workers=options['workers']).run()
+        for user in sync.created:
+            self.stdout.write("New user: %s %s, u: %s e: %s" % (
+                user.first_name, user.last_name, user.username, user.email))
+        self.stdout.write("%d members: %d new, %d reactivated, %d already active. %d deactivated" % (
+            len(members), len(sync.created), sync.reactivated, sync.unchanged, sync.deactivated))
+        if options['email']:
+            sent, failed = send_all(sync.welcome_emails())
+            self.stdout.write("Sent %d welcome emails" % sent)
+            # Their passwords aren't stored anywhere else, so the emails are printed to be passed on
+            for message in failed:
+                self.stderr.write("Couldn't send the welcome email to %s:" % message.to[0])
+                self.stderr.write(message.message().as_string())
+        else:
+            for message in sync.welcome_emails():
+                self.stdout.write(message.message().as_string())
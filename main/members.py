@@ -0,0 +1,161 @@
+"""
+Syncing the club's user accounts with a membership signup sheet.
+"""
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import logging
+import string
+from allauth.account.models import EmailAddress
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.sites.models import Site
+from django.core import mail
+from django.db import transaction
+from django.template.loader import render_to_string
+
+Member = namedtuple('Member', ('first_name', 'last_name', 'email'))
+# Copied in on every welcome email
+CC = "admin@ucbc.org.nz"
+log = logging.getLogger(__name__)
+
+
+def hash_passwords(passwords, workers=1):
+    """
+    make_password() for each of ``passwords``. Password hashing is deliberately slow
+    (PBKDF2 takes tens of milliseconds), so with ``workers`` > 1 it's spread over a pool
+    of processes.
+    """
+    if workers <= 1 or len(passwords) < 2:
+        return [make_password(password) for password in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(make_password, passwords))
+
+
+def read_members(lines):
+    """ The members on a signup sheet CSV (first name, last name, username, email), once each """
+    members = OrderedDict()
+    for row in csv.reader(lines):
+        if len(row) < 4 or not row[3].strip():
+            continue
+        first_name, last_name, _, email = [value.strip() for value in row[:4]]
+        members.setdefault(email.lower(), Member(first_name, last_name, email))
+    return list(members.values())
+
+
+class MembershipSync(object):
+    """
+    Brings the user accounts in line with ``members``: creates accounts (and verified
+    EmailAddresses) for new members, reactivates returning members and deactivates
+    everyone else, staff excepted. ``welcome_emails`` are ready to send to the new members.
+    """
+    WELCOME_SUBJECT = 'Welcome to the UC Brew Club Website'
+
+    def __init__(self, members, workers=1):
+        self.members = members
+        self.workers = workers
+        self.created = []
+        self.passwords = {}
+        self.deactivated = 0
+        self.reactivated = 0
+        self.unchanged = 0
+
+    def run(self):
+        User = get_user_model()
+        listed = set(m.email.lower() for m in self.members)
+        accounts = User.objects.values_list('id', 'email', 'is_active', 'is_staff')
+        existing, deactivate, reactivate = set(), [], []
+        for id_, email, is_active, is_staff in accounts:
+            email = email.lower()
+            existing.add(email)
+            if email in listed and not is_active:
+                reactivate.append(id_)
+            elif email not in listed and is_active and not is_staff:
+                deactivate.append(id_)
+            elif email in listed:
+                self.unchanged += 1
+        # Built (passwords hashed) before the transaction, so the database isn't locked meanwhile
+        users = self._new_users([m for m in self.members if m.email.lower() not in existing])
+        with transaction.atomic():
+            # Only the accounts whose status changes are touched, so members can log in throughout
+            self.deactivated = User.objects.filter(id__in=deactivate, is_active=True).update(is_active=False)
+            self.reactivated = User.objects.filter(id__in=reactivate, is_active=False).update(is_active=True)
+            User.objects.bulk_create(users)
+            # bulk_create() doesn't set the ids
+            ids = dict(User.objects.filter(is_active=True).values_list('email', 'id'))
+            for user in users:
+                user.id = ids[user.email]
+            self.created = users
+            self._create_email_addresses()
+        return self
+
+    def _new_users(self, members):
+        User = get_user_model()
+        usernames = set(User.objects.values_list('username', flat=True))
+        passwords = [User.objects.make_random_password(10, string.ascii_lowercase) for _ in members]
+        users = []
+        for member, password, hashed in zip(members, passwords, hash_passwords(passwords, self.workers)):
+            users.append(User(
+                username=self._username(member, usernames),
+                first_name=member.first_name,
+                last_name=member.last_name,
+                email=member.email,
+                password=hashed))
+            self.passwords[member.email] = password
+        return users
+
+    @staticmethod
+    def _username(member, taken):
+        """ firstnamelastname, numbered if that's already taken """
+        base = (member.first_name + member.last_name).lower().replace(" ", "")[:27]
+        username, n = base, 1
+        while username in taken:
+            n += 1
+            username = "%s%d" % (base, n)
+        taken.add(username)
+        return username
+
+    def _create_email_addresses(self):
+        """ Verified primary EmailAddresses for the listed members' accounts that don't have one """
+        emails = set(m.email.lower() for m in self.members)
+        have = set(EmailAddress.objects.values_list('user_id', flat=True))
+        EmailAddress.objects.bulk_create([
+            EmailAddress(user_id=id_, email=email, verified=True, primary=True)
+            for id_, email in get_user_model().objects.filter(is_active=True).values_list('id', 'email')
+            if email.lower() in emails and id_ not in have])
+
+    def welcome_emails(self):
+        current_site = Site.objects.get_current()
+        for user in self.created:
+            message = render_to_string(
+                'account/email/email_confirmation_signup_message.txt', {
+                    'username': user.username,
+                    'password': self.passwords[user.email],
+                    'first_name': user.first_name,
+                    'current_site': current_site,
+                })
+            yield mail.EmailMessage(self.WELCOME_SUBJECT, message, None, [user.email, CC])
+
+
+def send_all(messages):
+    """
+    Send the messages over a single SMTP connection, one at a time so a message that can't
+    be sent doesn't stop the rest. Returns the number sent and the messages that weren't.
+    """
+    connection = mail.get_connection(fail_silently=False)
+    sent, failed = 0, []
+    try:
+        connection.open()
+    except Exception:
+        # send_messages() tries again for each message
+        log.exception("Couldn't connect to the mail server")
+    try:
+        for message in messages:
+            try:
+                sent += connection.send_messages([message]) or 0
+            except Exception:
+                log.exception("Couldn't send %r to %s" % (message.subject, ", ".join(message.to)))
+                failed.append(message)
+    finally:
+        connection.close()
+    return sent, failed
@@ -0,0 +1,11 @@
+from main import cache
+
+
+class VersionStampMiddleware(object):
+    """
+    Bumps the version stamps bumped during the request again once the request's
+    transactions (e.g. the admin's) have committed, see main.cache.VersionStamp.bump
+    """
+    def process_response(self, request, response):
+        cache.bump_committed()
+        return response
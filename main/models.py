@@ -1,5 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 from django.db import models
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from flatblocks.models import FlatBlock
+from main import signals
+
 
 class UserRole(models.Model):
     name = models.CharField(max_length=255, blank=True, null=True)
@@ -15,3 +20,15 @@ class BrewtoadAccount(models.Model):
     def url(self):
         return "http://brewtoad.com/users/%d" % self.brewtoad_user_id
 
+
+post_save.connect(signals.flatblock_changed, sender=FlatBlock, dispatch_uid="flatblock_saved_pages")
+post_delete.connect(signals.flatblock_changed, sender=FlatBlock, dispatch_uid="flatblock_deleted_pages")
+post_save.connect(signals.committee_changed, sender=Group, dispatch_uid="group_saved_committee")
+post_delete.connect(signals.committee_changed, sender=Group, dispatch_uid="group_deleted_committee")
+m2m_changed.connect(signals.committee_changed, sender=get_user_model().groups.through,
+                    dispatch_uid="group_membership_changed_committee")
+for sender in (get_user_model(), UserRole, BrewtoadAccount):
+    post_save.connect(signals.committee_member_changed, sender=sender,
+                      dispatch_uid="%s_saved_committee" % sender.__name__)
+    post_delete.connect(signals.committee_member_changed, sender=sender,
+                        dispatch_uid="%s_deleted_committee" % sender.__name__)
@@ -0,0 +1,17 @@
+from main.cache import VersionStamp, FLATBLOCKS, COMMITTEE
+
+
+def flatblock_changed(sender, **kwargs):
+    VersionStamp(FLATBLOCKS).bump()
+
+
+def committee_changed(sender, **kwargs):
+    # m2m_changed is sent before and after each change to group memberships
+    if kwargs.get('action', 'post_').startswith('post_'):
+        VersionStamp(COMMITTEE).bump()
+
+
+def committee_member_changed(sender, **kwargs):
+    # Logging in only updates last_login
+    if set(kwargs.get('update_fields') or ()) != set(['last_login']):
+        VersionStamp(COMMITTEE).bump()
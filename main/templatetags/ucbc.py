@@ -1,5 +1,8 @@
 from django import template
-from main import __version__
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from flatblocks.models import FlatBlock
+from main import __version__, blocks
 
 register = template.Library()
 
@@ -13,3 +16,21 @@ def version(*args, **kwargs):
 def to_class_name(value):
     return value.__class__.__name__
 
+
+
+@register.simple_tag
+def cached_flatblock(slug):
+    """ flatblock_tags' flatblock, without the query (see main.blocks) """
+    try:
+        return render_to_string('flatblocks/flatblock.html', {'flatblock': blocks.get(slug)})
+    except FlatBlock.DoesNotExist:
+        return ''
+
+
+@register.simple_tag
+def cached_plain_flatblock(slug):
+    """ flatblock_tags' plain_flatblock, without the query """
+    try:
+        return mark_safe(blocks.get(slug).content)
+    except FlatBlock.DoesNotExist:
+        return ''
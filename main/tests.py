@@ -1,12 +1,22 @@
 from http.client import INTERNAL_SERVER_ERROR, NOT_FOUND
+from allauth.account.models import EmailAddress
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import Group
+from django.core.cache import get_cache
+from django.core import mail
 from django.core.urlresolvers import reverse
 from django.db import IntegrityError
 from django_nose.tools import assert_ok, assert_code
-from nose.tools import assert_equal, assert_in, raises
-from django.test import Client
-from main import __version__
-from main.models import BrewtoadAccount
+from nose.tools import assert_equal, assert_in, assert_not_equal, raises
+from django.test import Client, TestCase
+import mock
+import smtplib
+from main import __version__, blocks, mail as pooled_mail
+from main.members import MembershipSync, hash_passwords, read_members, send_all
+from main.cache import VersionStamp
+from main.committee import roster
+from main.models import BrewtoadAccount, UserRole
 from main.templatetags.ucbc import version
 from flatblocks.models import FlatBlock
 
@@ -47,3 +57,270 @@ def test_brewtoad_null_id():
         brewtoad_user_id=None,
         user=get_user_model().objects.create(username='testuser1', password='1234'))
 
+
+
+class TestMembershipSync(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.staff = User.objects.create(username="staff", email="staff@ucbc.org.nz", is_staff=True)
+        self.returning = User.objects.create(username="joebloggs", email="joe@uclive.ac.nz", is_active=False)
+        self.lapsed = User.objects.create(username="old", email="old@uclive.ac.nz")
+
+    def sync(self):
+        return MembershipSync(read_members([
+            "Joe,Bloggs,jb1,JOE@uclive.ac.nz\n",
+            "Jane,Doe,jd1,jane@uclive.ac.nz\n",
+            "Jane,Doe,jd1,jane@uclive.ac.nz\n",
+            "John,Bloggs,jb2,john@uclive.ac.nz\n",
+        ])).run()
+
+    def active(self):
+        return sorted(get_user_model().objects.filter(is_active=True).values_list('username', flat=True))
+
+    def test_sync(self):
+        sync = self.sync()
+        assert_equal(["janedoe", "joebloggs", "johnbloggs", "staff"], self.active())
+        assert_equal(["jane@uclive.ac.nz", "john@uclive.ac.nz"], [u.email for u in sync.created])
+        jane = get_user_model().objects.get(username="janedoe")
+        self.assertTrue(jane.check_password(sync.passwords["jane@uclive.ac.nz"]))
+        self.assertTrue(EmailAddress.objects.get(user=jane, email=jane.email).verified)
+
+    def test_only_changed_accounts_updated(self):
+        get_user_model().objects.create(username="current", email="jane@uclive.ac.nz")
+        get_user_model().objects.create(username="gone", email="gone@uclive.ac.nz", is_active=False)
+        sync = self.sync()
+        assert_equal((1, 1, 1), (sync.reactivated, sync.deactivated, sync.unchanged))
+        assert_equal(["current", "joebloggs", "johnbloggs", "staff"], self.active())
+
+    def test_welcome_emails_sent_over_one_connection(self):
+        sync = self.sync()
+        with mock.patch('django.core.mail.get_connection', wraps=mail.get_connection) as get_connection:
+            assert_equal((2, []), send_all(sync.welcome_emails()))
+        assert_equal(1, get_connection.call_count)
+        assert_equal(["jane@uclive.ac.nz", "admin@ucbc.org.nz"], mail.outbox[0].to)
+
+    def test_failed_welcome_doesnt_stop_the_rest(self):
+        sync = self.sync()
+        refused = smtplib.SMTPRecipientsRefused({"jane@uclive.ac.nz": (550, b"No such user")})
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=[refused, 1]):
+            sent, failed = send_all(sync.welcome_emails())
+        assert_equal(1, sent)
+        assert_equal([["jane@uclive.ac.nz", "admin@ucbc.org.nz"]], [message.to for message in failed])
+        assert_in(sync.passwords["jane@uclive.ac.nz"], failed[0].body)
+
+    def test_username_taken(self):
+        get_user_model().objects.create(username="janedoe", email="otherjane@uclive.ac.nz")
+        self.sync()
+        assert_equal("janedoe2", get_user_model().objects.get(email="jane@uclive.ac.nz").username)
+
+
+def test_hash_passwords_in_pool():
+    passwords = ["password%d" % i for i in range(4)]
+    hashed = hash_passwords(passwords, workers=2)
+    assert_equal([True] * 4, [check_password(p, h) for p, h in zip(passwords, hashed)])
+
+
+class TestPooledEmailBackend(object):
+    def setup(self):
+        pooled_mail._slots.clear()
+        self.patch = mock.patch('smtplib.SMTP')
+        self.SMTP = self.patch.start()
+        self.SMTP.return_value.noop.return_value = (250, b'OK')
+
+    def teardown(self):
+        self.patch.stop()
+        pooled_mail._slots.clear()
+
+    def send(self, **kwargs):
+        kwargs = dict(dict(host='localhost', port=1025, username='', password='', use_tls=False), **kwargs)
+        connection = mail.get_connection('main.mail.PooledEmailBackend', **kwargs)
+        sent = connection.send_messages([mail.EmailMessage("Subject", "Body", "a@example.com", ["b@example.com"])])
+        connection.close()
+        return sent
+
+    def test_connection_reused(self):
+        assert_equal([1, 1], [self.send(), self.send()])
+        assert_equal(1, self.SMTP.call_count)
+        assert_equal(2, self.SMTP.return_value.sendmail.call_count)
+        assert_equal(0, self.SMTP.return_value.quit.call_count)
+
+    def test_connection_per_credentials(self):
+        self.send()
+        self.send(port=1026)
+        self.send()
+        assert_equal(2, self.SMTP.call_count)
+
+    def test_reconnects_when_dropped(self):
+        self.send()
+        self.SMTP.return_value.sendmail.side_effect = [smtplib.SMTPServerDisconnected(), {}]
+        assert_equal(1, self.send())
+        assert_equal(2, self.SMTP.call_count)
+
+    def test_idle_connection_checked(self):
+        self.send()
+        pooled_mail._slots[('localhost', 1025, '', '', False, False)].last_used -= 3600
+        self.SMTP.return_value.noop.return_value = (421, b'Timeout')
+        self.send()
+        assert_equal(2, self.SMTP.call_count)
+
+    def test_fail_silently(self):
+        self.SMTP.return_value.sendmail.side_effect = smtplib.SMTPRecipientsRefused({})
+        connection = mail.get_connection(
+            'main.mail.PooledEmailBackend', host='localhost', port=1025, username='', password='',
+            use_tls=False, fail_silently=True)
+        assert_equal(0, connection.send_messages([mail.EmailMessage("Subject", "Body", "a@example.com", ["b@example.com"])]))
+
+
+class TestAnonymousPageCache(TestCase):
+    def setUp(self):
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='page-tests')
+        cache.clear()
+        self.cache_patch = mock.patch('main.cache.cache', cache)
+        self.cache_patch.start()
+        for slug in ('frontpage', 'menu.howtos'):
+            FlatBlock.objects.create(slug=slug, header=slug, content=slug)
+
+    def tearDown(self):
+        self.cache_patch.stop()
+
+    def x_cache(self, url, **extra):
+        return Client().get(url, **extra).get('X-Cache')
+
+    def test_hit_until_flatblock_changes(self):
+        assert_equal(["MISS", "HIT"], [self.x_cache('/'), self.x_cache('/')])
+        block = FlatBlock.objects.get(slug='frontpage')
+        block.content = "Updated"
+        block.save()
+        response = Client().get('/')
+        assert_equal("MISS", response['X-Cache'])
+        assert_in("Updated", response.content.decode('utf-8'))
+
+    def test_committee_membership_invalidates(self):
+        committee = Group.objects.create(name="Committee")
+        url = reverse('committee')
+        assert_equal(["MISS", "HIT"], [self.x_cache(url), self.x_cache(url)])
+        get_user_model().objects.create(username="jane").groups.add(committee)
+        assert_equal("MISS", self.x_cache(url))
+
+    def test_per_variant(self):
+        iphone = ("Mozilla/5.0 (iPhone; CPU iPhone OS 7_0 like Mac OS X) AppleWebKit/537.51.1 "
+                  "(KHTML, like Gecko) Version/7.0 Mobile/11A465 Safari/9537.53")
+        self.x_cache('/')
+        assert_equal(["MISS", "HIT"], [self.x_cache('/', HTTP_USER_AGENT=iphone), self.x_cache('/', HTTP_USER_AGENT=iphone)])
+
+    def test_query_strings_and_hosts(self):
+        assert_equal([None, None], [self.x_cache('/?x=1'), self.x_cache('/?x=1')])
+        self.x_cache('/')
+        assert_equal("HIT", self.x_cache('/', HTTP_HOST="example.com"))
+
+    def test_not_cached_for_users(self):
+        get_user_model().objects.create_user("jane", "jane@uclive.ac.nz", "password")
+        client = Client()
+        client.login(username="jane", password="password")
+        assert_equal([None, None], [client.get('/').get('X-Cache'), client.get('/').get('X-Cache')])
+
+
+class TestFlatBlockCache(TestCase):
+    def setUp(self):
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='flatblock-tests')
+        cache.clear()
+        self.cache_patch = mock.patch('main.cache.cache', cache)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+
+    def test_cached_until_saved(self):
+        block = FlatBlock.objects.create(slug='test.block', header="Heading", content="Before")
+        blocks.get('test.block')
+        with self.assertNumQueries(0):
+            assert_equal("Before", blocks.get('test.block').content)
+        block.content = "After"
+        block.save()
+        assert_equal("After", blocks.get('test.block').content)
+
+    def test_missing_cached(self):
+        self.assertRaises(FlatBlock.DoesNotExist, blocks.get, 'test.missing')
+        with self.assertNumQueries(0):
+            self.assertRaises(FlatBlock.DoesNotExist, blocks.get, 'test.missing')
+        FlatBlock.objects.create(slug='test.missing', header="Heading", content="Now here")
+        assert_equal("Now here", blocks.get('test.missing').content)
+
+
+class TestCommitteeRoster(TestCase):
+    def setUp(self):
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='committee-tests')
+        cache.clear()
+        self.cache_patch = mock.patch('main.cache.cache', cache)
+        self.cache_patch.start()
+        self.committee = Group.objects.create(name="Committee")
+        self.jane = get_user_model().objects.create(username="jane", first_name="Jane", email="jane@uclive.ac.nz")
+        self.jane.groups.add(self.committee)
+        UserRole.objects.create(user=self.jane, name="President")
+        self.account = BrewtoadAccount.objects.create(user=self.jane, brewtoad_user_id=123)
+        get_user_model().objects.create(username="joe", first_name="Joe")
+
+    def tearDown(self):
+        self.cache_patch.stop()
+
+    def test_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            members = roster()
+        assert_equal(1, len(members))
+        assert_equal(("Jane", "President", "http://brewtoad.com/users/123"),
+                     (members[0].first_name, members[0].role, members[0].brewtoad_url))
+        assert_in("gravatar.com", members[0].avatar_url)
+        with self.assertNumQueries(0):
+            assert_equal(members, roster())
+
+    def test_rebuilt_when_profile_changes(self):
+        roster()
+        self.account.brewtoad_user_id = 456
+        self.account.save()
+        assert_equal("http://brewtoad.com/users/456", roster()[0].brewtoad_url)
+
+    def test_login_doesnt_invalidate(self):
+        roster()
+        self.jane.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            roster()
+
+
+class TestVersionStamp(TestCase):
+    def setUp(self):
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='stamp-tests')
+        cache.clear()
+        self.cache_patch = mock.patch('main.cache.cache', cache)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+
+    def test_bumped_again_after_commit(self):
+        stamp = VersionStamp("test")
+        with mock.patch('main.cache.connection') as connection:
+            connection.in_atomic_block = True
+            version = stamp.bump()
+            assert_equal(version, stamp.get())
+            connection.in_atomic_block = False
+            assert_not_equal(version, stamp.get())
+
+    def test_middleware_bumps_after_request(self):
+        version = VersionStamp("main.flatblocks").get()
+        FlatBlock.objects.create(slug='test.block', header="Heading", content="Content")
+        bumped = VersionStamp("main.flatblocks").get()
+        assert_not_equal(version, bumped)
+        with mock.patch('main.cache.connection') as connection:
+            connection.in_atomic_block = False
+            Client().get('/')
+        assert_not_equal(bumped, VersionStamp("main.flatblocks").get())
+
+    def test_not_stored_if_bumped_while_building(self):
+        stamp = VersionStamp("test")
+
+        def build():
+            stamp.bump()
+            return "stale"
+        assert_equal("stale", stamp.get_or_build("value", build))
+        assert_equal("fresh", stamp.get_or_build("value", lambda: "fresh"))
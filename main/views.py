@@ -1,11 +1,14 @@
-from django.contrib.auth import get_user_model
 from django.shortcuts import render
 from django.http import HttpResponse, HttpResponseNotFound, HttpResponseServerError
 from django.template import RequestContext
 from django.shortcuts import render_to_response
 from flatblocks.models import FlatBlock
+from main import blocks
+from main.committee import roster
+from main.cache import cache_anonymous_page, FLATBLOCKS, COMMITTEE
 
 
+@cache_anonymous_page(FLATBLOCKS)
 def index(request):
     return render_to_response(
         'index.html',
@@ -13,15 +16,16 @@ def index(request):
         context_instance=RequestContext(request))
 
 
+@cache_anonymous_page(FLATBLOCKS)
 def howto(request, name):
     try:
-        flatblock = FlatBlock.objects.get(slug=name)
+        blocks.get(name)
         return render(request, 'main/howto.html', {'howto_name': name})
     except FlatBlock.DoesNotExist:
         return HttpResponseNotFound('Could not find the howto: %s' % name)
     return HttpResponseServerError('Error rendering the howto: %s' % name)
 
 
+@cache_anonymous_page(FLATBLOCKS, COMMITTEE)
 def committee(request):
-    users = get_user_model().objects.filter(groups__name="Committee")
-    return render(request, 'main/committee.html', {'users': users})
+    return render(request, 'main/committee.html', {'members': roster()})
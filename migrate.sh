@@ -8,3 +8,5 @@
 ./manage.py schemamigration main --auto
 #./manage.py migrate --fake
 ./manage.py migrate
+./manage.py rebuild_order_totals
+./manage.py reconcile_supplier_orders
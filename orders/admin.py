@@ -1,6 +1,6 @@
 from functools import partial
 from django.contrib import admin, messages
-from .models import Grain, Hop, UserOrder, Supplier, OrderItem, SupplierOrder, OrdersEnabled, Surcharge
+from .models import Grain, Hop, UserOrder, Supplier, OrderItem, SupplierOrder, OrdersEnabled, Surcharge, OutgoingEmail
 from orders.forms import SupplierOrderAdminForm
 
 
@@ -23,6 +23,7 @@ class ReadOnlyOrderItemInline(OrderItemInline):
 
 def flag_as_paid(modeladmin, request, queryset):
     queryset.update(status=UserOrder.STATUS_PAID)
+    UserOrder.sync_supplier_orders(queryset)
 
 
 class UserOrderAdmin(admin.ModelAdmin):
@@ -34,22 +35,13 @@ class UserOrderAdmin(admin.ModelAdmin):
 
 class SupplierOrderAdmin(admin.ModelAdmin):
     list_display = ("supplier_name", "status", "total_excl_gst")
-    readonly_fields = ("supplier", "total_excl_gst", "total_incl_gst")
+    readonly_fields = ("supplier", "total_excl_gst", "display_total_incl_gst")
     change_form_template = 'orders/supplier_order_change_form.html'
 
     def get_queryset(self, request):
-        supplier_orders = SupplierOrder.objects.filter(status=SupplierOrder.STATUS_PENDING)
-        for supplier in Supplier.objects.all():
-            order, _ = supplier_orders.get_or_create(supplier=supplier)
-            OrderItem.objects.filter(
-                supplier_order=None,
-                user_order__status=UserOrder.STATUS_PAID,
-                ingredient__supplier=supplier).update(supplier_order=order)
-            OrderItem.objects.filter(
-                supplier_order=order,
-                user_order__status=UserOrder.STATUS_UNPAID,
-                ingredient__supplier=supplier).update(supplier_order=None)
-        return SupplierOrder.objects.all()
+        # Items are moved into pending orders as user orders are paid, see
+        # UserOrder.sync_supplier_orders() and the reconcile_supplier_orders command
+        return super(SupplierOrderAdmin, self).get_queryset(request).select_related('supplier')
 
     def has_add_permission(self, request):
         return False
@@ -61,11 +53,11 @@ class SupplierOrderAdmin(admin.ModelAdmin):
 def add_to_supplier_order(supplier_order, modeladmin, request, queryset):
     if queryset.filter(user_order__status=UserOrder.STATUS_UNPAID).count() > 0:
         messages.warning(request, "Some order items selected could not be added to supplier order as they havn't been paid for")
-    queryset.filter(user_order__status=UserOrder.STATUS_PAID).update(supplier_order=supplier_order)
+    OrderItem.assign_supplier_order(queryset.filter(user_order__status=UserOrder.STATUS_PAID), supplier_order)
 
 
 def remove_from_supplier_orders(modeladmin, request, queryset):
-    queryset.update(supplier_order=None)
+    OrderItem.assign_supplier_order(queryset, None)
 
 
 class OrderItemAdmin(admin.ModelAdmin):
@@ -100,6 +92,12 @@ class SurchargeAdmin(admin.ModelAdmin):
         return "Surcharges"
 
 
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ("key", "recipients", "status", "attempts", "created", "sent")
+    list_filter = ("status",)
+    readonly_fields = ("attempts", "last_error", "claimed", "sent")
+
+
 admin.site.register(Grain, IngredientAdmin)
 admin.site.register(Hop, IngredientAdmin)
 admin.site.register(UserOrder, UserOrderAdmin)
@@ -108,3 +106,4 @@ admin.site.register(SupplierOrder, SupplierOrderAdmin)
 admin.site.register(OrderItem, OrderItemAdmin)
 admin.site.register(OrdersEnabled, OrdersEnabledAdmin)
 admin.site.register(Surcharge, SurchargeAdmin)
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
@@ -0,0 +1,64 @@
+"""
+The ingredient catalog shown on the order pages.
+
+Anything derived from the catalog is keyed on the catalog version stamp, which is bumped
+whenever an Ingredient, Supplier or the Surcharge changes (see orders.signals).
+"""
+from django.forms.formsets import formset_factory
+from main.cache import VersionStamp, VersionedMemo
+from orders.forms import CartItemForm
+from orders.models import Ingredient, Grain, Hop, Surcharge
+
+CATALOG = "orders.catalog"
+
+_formset_classes = VersionedMemo(CATALOG, dict)
+
+
+def invalidate():
+    VersionStamp(CATALOG).bump()
+
+
+def snapshot(name, queryset):
+    """
+    Compact [(name, unit cost excl. GST incl. surcharge, unit size), ...] for the ingredients
+    in ``queryset``, built once per catalog version and shared between processes.
+    ``name`` identifies the queryset, e.g. the page showing it.
+    """
+    def build():
+        factor = Surcharge.get_factor()
+        return [(ingredient_name, float(unit_cost) * factor, unit_size)
+                for ingredient_name, unit_cost, unit_size
+                in queryset.values_list('name', 'unit_cost', 'unit_size')]
+    return VersionStamp(CATALOG).get_or_build("snapshot:%s" % name, build)
+
+
+def ingredient_index():
+    """
+    {name: Hop or Grain} for the whole catalog, loaded in a single query and shared
+    between processes for the current catalog version.
+    """
+    def build():
+        index = {}
+        for ingredient in Ingredient.objects.select_related('hop', 'grain'):
+            concrete = _concrete(ingredient)
+            if concrete is not None:
+                index[ingredient.name] = concrete
+        return index
+    return VersionStamp(CATALOG).get_or_build("ingredient_index", build)
+
+
+def _concrete(ingredient):
+    for subclass in (Hop, Grain):
+        try:
+            return getattr(ingredient, subclass._meta.model_name)
+        except subclass.DoesNotExist:
+            pass
+    return None
+
+
+def formset_class(max_num):
+    """ CartItemForm formset class for a catalog page listing ``max_num`` ingredients """
+    classes = _formset_classes.get()
+    if max_num not in classes:
+        classes[max_num] = formset_factory(CartItemForm, max_num=max_num)
+    return classes[max_num]
@@ -0,0 +1,6 @@
+from orders.models import OrdersEnabled
+
+
+def orders_enabled(request):
+    # Passed uncalled so the (cached) flag is only looked up by templates that use it
+    return {'orders_enabled': OrdersEnabled.is_enabled}
@@ -1,8 +1,9 @@
 from django import forms
 from django.contrib.admin.widgets import FilteredSelectMultiple, ForeignKeyRawIdWidget
 from django.contrib import admin
+from django.db import transaction
 from django.db.models import ManyToManyField
-from django.forms.models import BaseInlineFormSet
+from django.forms.formsets import BaseFormSet, formset_factory
 import orders
 
 from orders.models import OrderItem, SupplierOrder, Ingredient, UserOrder, Supplier
@@ -43,22 +44,48 @@ class CartItemForm(forms.Form):
         "value": "0"}))
 
 
-class OrderItemFormset(BaseInlineFormSet):
+class CartOrderItemForm(forms.Form):
+    ingredient = forms.IntegerField(widget=forms.HiddenInput())
+    quantity = forms.IntegerField(min_value=1, widget=forms.HiddenInput())
+
+
+class OrderItemFormset(BaseFormSet):
+    """
+    The items of a new UserOrder (``instance``). Validating looks up all the ingredients in
+    one query, saving inserts the order and its items in a single transaction.
+    """
+    def __init__(self, *args, **kwargs):
+        self.instance = kwargs.pop('instance')
+        self.items = []
+        super(OrderItemFormset, self).__init__(*args, **kwargs)
+
     def clean(self):
         super(OrderItemFormset, self).clean()
-        # Dirty hack as I can't get inline formsets to work
-        for i, form in enumerate(self.forms):
-            prefix = '%s-%d-' % (self.prefix, i)
-            ingredient_id = int(form.data.get(prefix + "ingredient"))
-            quantity = int(form.data.get(prefix + "quantity"))
-            form.instance.ingredient = Ingredient.objects.get(id=ingredient_id)
-            form.instance.quantity = quantity
-
-    def save(self, commit=True):
-        super(OrderItemFormset, self).save(commit=commit)
-        for form in self.forms:
-            if form.is_valid():
-                form.save()
+        if any(self.errors):
+            return
+        lines = [(f.cleaned_data['ingredient'], f.cleaned_data['quantity']) for f in self.forms if f.cleaned_data]
+        if not lines:
+            raise forms.ValidationError("Your order is empty")
+        ingredients = Ingredient.objects.in_bulk([ingredient_id for ingredient_id, _ in lines])
+        if len(ingredients) < len(set(ingredient_id for ingredient_id, _ in lines)):
+            raise forms.ValidationError("Some of the ingredients in your order are no longer available")
+        self.items = [OrderItem(ingredient=ingredients[ingredient_id], quantity=quantity)
+                      for ingredient_id, quantity in lines]
+
+    def save(self):
+        with transaction.atomic():
+            self.instance.save()
+            for item in self.items:
+                # bulk_create() skips OrderItem.save(), so freeze the prices here
+                item.user_order = self.instance
+                item.unit_cost = item.ingredient.unit_cost
+                item.surcharge_percentage = self.instance.surcharge_percentage
+            OrderItem.objects.bulk_create(self.items)
+            self.instance.refresh_totals()
+        return self.instance
+
+
+CartFormset = formset_factory(CartOrderItemForm, formset=OrderItemFormset, extra=0)
 
 
 class SupplierOrderAdminForm(forms.ModelForm):
@@ -86,8 +113,8 @@ class SupplierOrderAdminForm(forms.ModelForm):
     def save(self, *args, **kwargs):
         instance = super(SupplierOrderAdminForm, self).save(commit=False)
         instance.save()
-        self.fields['ingredient_orders'].initial.update(supplier_order=None)
-        self.cleaned_data['ingredient_orders'].update(supplier_order=instance)
+        OrderItem.assign_supplier_order(self.fields['ingredient_orders'].initial, None)
+        OrderItem.assign_supplier_order(self.cleaned_data['ingredient_orders'], instance)
         return instance
 
 
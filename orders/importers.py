@@ -0,0 +1,219 @@
+"""
+Bulk import of supplier price lists, CSV files with a header row then
+name, unit cost, unit size and supplier name columns.
+"""
+from collections import namedtuple
+import codecs
+import csv
+from decimal import Decimal, InvalidOperation
+import hashlib
+from django.db import connection, transaction
+from orders import catalog
+from orders.models import Ingredient, OrderItem, Supplier
+
+RowError = namedtuple('RowError', ('line_num', 'message'))
+# old and new are (unit_cost, unit_size, supplier name)
+Change = namedtuple('Change', ('name', 'old', 'new'))
+
+
+class _DryRun(Exception):
+    pass
+
+
+def _chunks(seq, size):
+    for start in range(0, len(seq), size):
+        yield seq[start:start + size]
+
+
+def _lines(chunks):
+    """ The lines in ``chunks`` of bytes, which needn't start or end on a line boundary """
+    rest = b""
+    for chunk in chunks:
+        lines = (rest + chunk).splitlines(True)
+        rest = lines.pop() if lines and not lines[-1].endswith(b"\n") else b""
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+
+class IngredientImporter(object):
+    """
+    Imports the rows of a CSV into ``model`` (Grain or Hop), all in one transaction.
+
+    Rows are compared with the stored ingredients by a digest of their normalised values,
+    so only new and changed ingredients are written. With ``remove_missing``, the model's
+    ingredients from the suppliers in the file that it no longer lists are deleted, unless
+    they've been ordered. With ``dry_run`` the import is rolled back, leaving the report:
+    ``created``, ``updated``, ``removed``, ``kept`` (ordered, so not removed) and ``errors``
+    (invalid rows, which are skipped).
+    """
+    BATCH_SIZE = 500
+    # Keeps each CASE ... UPDATE under SQLite's 999 parameter limit
+    UPDATE_BATCH_SIZE = 100
+    COLUMNS = ('unit_cost', 'unit_size', 'supplier_id', 'import_hash')
+
+    def __init__(self, model, remove_missing=False, dry_run=False):
+        self.model = model
+        self.remove_missing = remove_missing
+        self.dry_run = dry_run
+        self.errors = []
+        self.created = []
+        self.updated = []
+        self.removed = []
+        self.kept = []
+        self.unchanged = 0
+        self._suppliers = None
+        self._supplier_names = None
+        self._unit_sizes = set(u.name for u in Ingredient.UNITS)
+        self._listed = set()
+        self._listed_supplier_ids = set()
+
+    def run(self, chunks):
+        """ Import from ``chunks``, an iterable of byte strings (e.g. UploadedFile.chunks()) """
+        self._suppliers = dict(Supplier.objects.values_list('name', 'id'))
+        self._supplier_names = dict((id_, name) for name, id_ in self._suppliers.items())
+        # utf-8-sig drops the byte order mark spreadsheets put at the start of a CSV
+        reader = csv.reader(codecs.iterdecode(_lines(chunks), 'utf-8-sig'))
+        try:
+            with transaction.atomic():
+                batch = []
+                for row in reader:
+                    if reader.line_num == 1 or not any(row):
+                        continue
+                    values = self._clean(reader.line_num, row)
+                    if values is not None:
+                        batch.append(values)
+                    if len(batch) == self.BATCH_SIZE:
+                        self._save(batch)
+                        batch = []
+                self._save(batch)
+                if self.remove_missing:
+                    self._remove_missing()
+                if self.dry_run:
+                    raise _DryRun()
+        except _DryRun:
+            pass
+        if not self.dry_run and (self.created or self.updated or self.removed):
+            catalog.invalidate()
+        return self
+
+    def _clean(self, line_num, row):
+        """ The row as a dict of Ingredient field values, or None if it's invalid """
+        try:
+            name, unit_cost, unit_size, supplier_name = [value.strip() for value in row[:4]]
+        except ValueError:
+            return self._error(line_num, "Expected name, unit cost, unit size and supplier columns")
+        if not name or len(name) > Ingredient._meta.get_field('name').max_length:
+            return self._error(line_num, "Invalid name: '%s'" % name)
+        if name in self._listed:
+            return self._error(line_num, "%s is listed more than once" % name)
+        # Still listed if the rest of the row is invalid, so it isn't removed
+        self._listed.add(name)
+        try:
+            unit_cost = Decimal(unit_cost).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            return self._error(line_num, "Invalid unit cost: '%s'" % unit_cost)
+        if not Decimal(0) <= unit_cost < Decimal(1000):
+            return self._error(line_num, "Unit cost out of range: %s" % unit_cost)
+        if unit_size not in self._unit_sizes:
+            return self._error(line_num, "Unknown unit size: '%s'" % unit_size)
+        if supplier_name not in self._suppliers:
+            return self._error(line_num, "Unknown supplier: '%s'" % supplier_name)
+        self._listed_supplier_ids.add(self._suppliers[supplier_name])
+        return dict(
+            line_num=line_num,
+            name=name,
+            unit_cost=unit_cost,
+            unit_size=unit_size,
+            supplier_id=self._suppliers[supplier_name],
+            import_hash=self._hash(name, unit_cost, unit_size, supplier_name))
+
+    @staticmethod
+    def _hash(*values):
+        return hashlib.sha1("\x1f".join(str(v) for v in values).encode('utf-8')).hexdigest()
+
+    def _error(self, line_num, message):
+        self.errors.append(RowError(line_num, message))
+
+    def _describe(self, unit_cost, unit_size, supplier_id, import_hash=None):
+        return unit_cost, unit_size, self._supplier_names.get(supplier_id)
+
+    def _save(self, batch):
+        if not batch:
+            return
+        names = [values['name'] for values in batch]
+        existing = dict((row[0], row[1:]) for row in Ingredient.objects.filter(name__in=names).values_list(
+            'name', 'id', *self.COLUMNS))
+        own = set()
+        if existing:
+            own = set(self.model.objects.filter(name__in=list(existing)).values_list('name', flat=True))
+        new, changed = [], []
+        for values in batch:
+            if values['name'] not in existing:
+                new.append(values)
+            elif values['name'] not in own:
+                self._error(values['line_num'], "%s already exists and isn't a %s" % (
+                    values['name'], self.model._meta.verbose_name))
+            else:
+                id_, stored = existing[values['name']][0], existing[values['name']][1:]
+                stored_hash = stored[-1]
+                if stored_hash == values['import_hash']:
+                    self.unchanged += 1
+                    continue
+                if not stored_hash and tuple(stored[:-1]) == tuple(values[c] for c in self.COLUMNS[:-1]):
+                    # Imported before digests were stored, just store it
+                    self.unchanged += 1
+                else:
+                    self.updated.append(Change(
+                        values['name'],
+                        self._describe(*stored),
+                        self._describe(*(values[c] for c in self.COLUMNS))))
+                changed.append(dict(values, id=id_))
+        self._create(new)
+        self._update(changed)
+
+    def _create(self, rows):
+        """
+        bulk_create() can't insert multi-table inherited models, so insert the Ingredient
+        rows then their Grain/Hop rows
+        """
+        if not rows:
+            return
+        Ingredient.objects.bulk_create([Ingredient(
+            name=values['name'],
+            unit_cost=values['unit_cost'],
+            unit_size=values['unit_size'],
+            supplier_id=values['supplier_id'],
+            import_hash=values['import_hash']) for values in rows])
+        ids = Ingredient.objects.filter(name__in=[values['name'] for values in rows]).values_list('id', flat=True)
+        connection.cursor().executemany(
+            "INSERT INTO %s (ingredient_ptr_id) VALUES (%%s)" % self.model._meta.db_table,
+            [(id_,) for id_ in ids])
+        self.created.extend(values['name'] for values in rows)
+
+    def _update(self, rows):
+        """ Update each row's columns with one UPDATE ... SET column = CASE id ... per batch """
+        cursor = connection.cursor()
+        for batch in _chunks(rows, self.UPDATE_BATCH_SIZE):
+            assignments, params = [], []
+            for column in self.COLUMNS:
+                assignments.append("%s = CASE id %s END" % (column, " ".join(["WHEN %s THEN %s"] * len(batch))))
+                for values in batch:
+                    params.extend((values['id'], values[column]))
+            params.extend(values['id'] for values in batch)
+            cursor.execute("UPDATE %s SET %s WHERE id IN (%s)" % (
+                Ingredient._meta.db_table, ", ".join(assignments), ", ".join(["%s"] * len(batch))), params)
+
+    def _remove_missing(self):
+        """ Delete the listed suppliers' ingredients that the file doesn't list, unless ordered """
+        missing = dict((id_, name) for id_, name in self.model.objects.filter(
+            supplier__in=self._listed_supplier_ids).values_list('id', 'name') if name not in self._listed)
+        ordered = set()
+        for ids in _chunks(list(missing), self.BATCH_SIZE):
+            ordered.update(OrderItem.objects.filter(ingredient__in=ids).values_list('ingredient_id', flat=True))
+        removable = [id_ for id_ in missing if id_ not in ordered]
+        for ids in _chunks(removable, self.BATCH_SIZE):
+            self.model.objects.filter(pk__in=ids).delete()
+        self.kept = sorted(missing[id_] for id_ in ordered)
+        self.removed = sorted(missing[id_] for id_ in removable)
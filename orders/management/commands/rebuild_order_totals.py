@@ -0,0 +1,28 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from orders.models import UserOrder, SupplierOrder
+
+
+class Command(BaseCommand):
+    help = "Recalculate the stored UserOrder and SupplierOrder totals from their items"
+    option_list = BaseCommand.option_list + (
+        make_option('--check',
+                    action='store_true',
+                    dest='check',
+                    default=False,
+                    help="Only report orders whose stored totals are out of date"),
+    )
+
+    def handle(self, *args, **options):
+        stale = 0
+        for model in (UserOrder, SupplierOrder):
+            if options['check']:
+                ids = model.stale_totals()
+                stale += len(ids)
+                for id_ in ids:
+                    self.stdout.write("%s %d has stale totals" % (model.__name__, id_))
+            else:
+                count = len(model.update_totals(model.objects.all()))
+                self.stdout.write("Rebuilt totals for %d %s(s)" % (count, model.__name__))
+        if stale:
+            raise CommandError("%d order(s) with stale totals, run rebuild_order_totals to fix" % stale)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from orders.models import UserOrder
+
+
+class Command(BaseCommand):
+    help = ("Move order items into the pending supplier orders if they've been paid for, "
+            "or out of them if they haven't")
+
+    def handle(self, *args, **options):
+        moved = UserOrder.sync_supplier_orders(UserOrder.objects.all())
+        self.stdout.write("Moved %d order item(s)" % moved)
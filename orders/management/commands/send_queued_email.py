@@ -0,0 +1,103 @@
+from datetime import timedelta
+from itertools import groupby
+from optparse import make_option
+from django.core import mail
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+from orders.models import OutgoingEmail
+
+
+class Command(BaseCommand):
+    help = "Send the mail queued in the OutgoingEmail outbox, run it from cron"
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size',
+                    type='int',
+                    dest='batch_size',
+                    default=50,
+                    help="Messages sent per SMTP connection"),
+        make_option('--max-attempts',
+                    type='int',
+                    dest='max_attempts',
+                    default=5,
+                    help="Give up on a message after this many failed attempts"),
+    )
+
+    # A message claimed for longer than this was being sent by a run that died
+    CLAIM_TIMEOUT = timedelta(minutes=30)
+
+    def handle(self, *args, **options):
+        self.max_attempts = options['max_attempts']
+        self._release_stale_claims()
+        queued = OutgoingEmail.objects.filter(status=OutgoingEmail.STATUS_QUEUED).order_by('id')
+        sent = failed = 0
+        last_id = 0
+        # Each message is tried at most once per run, failures wait for the next run
+        while True:
+            batch = list(queued.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            batch.sort(key=lambda email: email.account)
+            for account, emails in groupby(batch, key=lambda email: email.account):
+                s, f = self._send(account, list(emails))
+                sent += s
+                failed += f
+        self.stdout.write("Sent %d message(s), %d failed" % (sent, failed))
+
+    def _send(self, account, emails):
+        """
+        Send emails over one connection, returns (sent, failed) counts. Each message is
+        claimed before it's sent and marked sent straight after, so overlapping runs don't
+        both send it and a run that dies doesn't leave delivered mail queued.
+        """
+        connection = mail.get_connection(fail_silently=False, **OutgoingEmail.connection_kwargs(account))
+        try:
+            connection.open()
+            open_error = None
+        except Exception as e:
+            open_error = e
+        sent = failed = 0
+        try:
+            for email in emails:
+                if not self._claim(email):
+                    # Another run has it
+                    continue
+                try:
+                    if open_error is not None:
+                        raise open_error
+                    connection.send_messages([email.message(connection)])
+                except Exception as e:
+                    self._failed(email, e)
+                    failed += 1
+                else:
+                    OutgoingEmail.objects.filter(id=email.id).update(
+                        status=OutgoingEmail.STATUS_SENT,
+                        sent=timezone.now())
+                    sent += 1
+        finally:
+            connection.close()
+        return sent, failed
+
+    def _claim(self, email):
+        """ Mark the message as being sent, False if it's no longer queued """
+        claimed = OutgoingEmail.objects.filter(id=email.id, status=OutgoingEmail.STATUS_QUEUED).update(
+            status=OutgoingEmail.STATUS_SENDING,
+            claimed=timezone.now(),
+            attempts=F('attempts') + 1)
+        email.attempts += 1
+        return bool(claimed)
+
+    def _failed(self, email, error):
+        status = OutgoingEmail.STATUS_FAILED if email.attempts >= self.max_attempts else OutgoingEmail.STATUS_QUEUED
+        OutgoingEmail.objects.filter(id=email.id).update(last_error=str(error), status=status)
+        self.stderr.write("Failed to send %s: %s" % (email.key, error))
+
+    def _release_stale_claims(self):
+        """ Requeue messages left claimed by a run that died (they may or may not have been sent) """
+        stale = OutgoingEmail.objects.filter(
+            status=OutgoingEmail.STATUS_SENDING,
+            claimed__lt=timezone.now() - self.CLAIM_TIMEOUT)
+        error = "Interrupted while sending"
+        stale.filter(attempts__gte=self.max_attempts).update(status=OutgoingEmail.STATUS_FAILED, last_error=error)
+        stale.update(status=OutgoingEmail.STATUS_QUEUED, last_error=error)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'SupplierOrder.subtotal_excl_gst'
+        db.add_column('orders_supplierorder', 'subtotal_excl_gst',
+                      self.gf('django.db.models.fields.FloatField')(default=0.0),
+                      keep_default=False)
+
+        # Adding field 'SupplierOrder.total_incl_gst'
+        db.add_column('orders_supplierorder', 'total_incl_gst',
+                      self.gf('django.db.models.fields.FloatField')(default=0.0),
+                      keep_default=False)
+
+        # Adding field 'UserOrder.subtotal_excl_gst'
+        db.add_column('orders_userorder', 'subtotal_excl_gst',
+                      self.gf('django.db.models.fields.FloatField')(default=0.0),
+                      keep_default=False)
+
+        # Adding field 'UserOrder.total_incl_gst'
+        db.add_column('orders_userorder', 'total_incl_gst',
+                      self.gf('django.db.models.fields.FloatField')(default=0.0),
+                      keep_default=False)
+
+
+    def backwards(self, orm):
+        # Deleting field 'SupplierOrder.subtotal_excl_gst'
+        db.delete_column('orders_supplierorder', 'subtotal_excl_gst')
+
+        # Deleting field 'SupplierOrder.total_incl_gst'
+        db.delete_column('orders_supplierorder', 'total_incl_gst')
+
+        # Deleting field 'UserOrder.subtotal_excl_gst'
+        db.delete_column('orders_userorder', 'subtotal_excl_gst')
+
+        # Deleting field 'UserOrder.total_incl_gst'
+        db.delete_column('orders_userorder', 'total_incl_gst')
+
+
+    models = {
+        'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '80', 'unique': 'True'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        'auth.permission': {
+            'Meta': {'ordering': "('content_type__app_label', 'content_type__model', 'codename')", 'unique_together': "(('content_type', 'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Group']", 'symmetrical': 'False', 'related_name': "'user_set'", 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'related_name': "'user_set'", 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'max_length': '30', 'unique': 'True'})
+        },
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'orders.grain': {
+            'Meta': {'object_name': 'Grain', '_ormbases': ['orders.Ingredient']},
+            'ingredient_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['orders.Ingredient']", 'unique': 'True', 'primary_key': 'True'})
+        },
+        'orders.hop': {
+            'Meta': {'object_name': 'Hop', '_ormbases': ['orders.Ingredient']},
+            'ingredient_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': "orm['orders.Ingredient']", 'unique': 'True', 'primary_key': 'True'})
+        },
+        'orders.ingredient': {
+            'Meta': {'object_name': 'Ingredient'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255', 'unique': 'True'}),
+            'supplier': ('django.db.models.fields.related.ForeignKey', [], {'default': 'None', 'to': "orm['orders.Supplier']", 'null': 'True', 'related_name': "'ingredients'"}),
+            'unit_cost': ('django.db.models.fields.DecimalField', [], {'max_digits': '5', 'decimal_places': '2'}),
+            'unit_size': ('django.db.models.fields.CharField', [], {'max_length': '255', 'null': 'True'})
+        },
+        'orders.orderitem': {
+            'Meta': {'object_name': 'OrderItem'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ingredient': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['orders.Ingredient']", 'related_name': "'single_ingredient_orders'"}),
+            'quantity': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'supplier_order': ('django.db.models.fields.related.ForeignKey', [], {'default': 'None', 'to': "orm['orders.SupplierOrder']", 'null': 'True', 'related_name': "'ingredient_orders'", 'blank': 'True'}),
+            'user_order': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['orders.UserOrder']", 'related_name': "'order_items'"})
+        },
+        'orders.ordersenabled': {
+            'Meta': {'object_name': 'OrdersEnabled'},
+            'enabled': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        'orders.supplier': {
+            'Meta': {'object_name': 'Supplier'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255'})
+        },
+        'orders.supplierorder': {
+            'Meta': {'object_name': 'SupplierOrder'},
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'pending'", 'max_length': '255'}),
+            'subtotal_excl_gst': ('django.db.models.fields.FloatField', [], {'default': '0.0'}),
+            'supplier': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['orders.Supplier']", 'related_name': "'orders'"}),
+            'total_incl_gst': ('django.db.models.fields.FloatField', [], {'default': '0.0'})
+        },
+        'orders.surcharge': {
+            'Meta': {'object_name': 'Surcharge'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'order_surcharge': ('django.db.models.fields.DecimalField', [], {'default': '0.0', 'max_digits': '6', 'decimal_places': '2'}),
+            'surcharge_percentage': ('django.db.models.fields.DecimalField', [], {'default': '0.0', 'max_digits': '5', 'decimal_places': '2'})
+        },
+        'orders.userorder': {
+            'Meta': {'object_name': 'UserOrder'},
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'unpaid'", 'max_length': '255'}),
+            'subtotal_excl_gst': ('django.db.models.fields.FloatField', [], {'default': '0.0'}),
+            'total_incl_gst': ('django.db.models.fields.FloatField', [], {'default': '0.0'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['auth.User']", 'related_name': "'orders'"})
+        }
+    }
+
+    complete_apps = ['orders']
\ No newline at end of file
@@ -1,5 +1,9 @@
-from django.db import models
+from collections import namedtuple
+from django.core.cache import cache
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth import get_user_model
+from main.cache import VersionedMemo
 
 # Register Signals
 from paypal.standard.ipn.signals import payment_was_successful
@@ -7,6 +11,10 @@ from orders import signals
 payment_was_successful.connect(signals.order_paid, dispatch_uid="paypal_payment_success")
 
 
+def surcharge_factor(surcharge_percentage):
+    return 1 + float(surcharge_percentage) / 100
+
+
 class Supplier(models.Model):
     name = models.CharField(max_length=255)
 
@@ -70,6 +78,8 @@ class Ingredient(models.Model):
         choices=((u.name, u.description) for u in UNITS),
         blank=False, null=True)
     supplier = models.ForeignKey(Supplier, related_name="ingredients", blank=False, null=True, default=None)
+    # Digest of the price list row this was last imported from, see orders.importers
+    import_hash = models.CharField(max_length=40, blank=True, editable=False)
 
     @staticmethod
     def unit_size_plural(unit_size, quantity):
@@ -83,6 +93,11 @@ class Ingredient(models.Model):
             raise ValueError("Invalid/unknown unit_size: %s" % unit_size)
         return unit.plural(quantity)
 
+    def save(self, *args, **kwargs):
+        # Edited outside the importer, so the next import compares the values themselves
+        self.import_hash = ""
+        return super(Ingredient, self).save(*args, **kwargs)
+
     def supplier_name(self):
         return self.supplier.name
 
@@ -106,11 +121,100 @@ class Hop(Ingredient):
 
 
 class _BaseOrder(models.Model):
+    """
+    Orders with stored totals. Subclasses say how the totals are calculated, in SQL, with
+    _items_column, _item_total_sql, _subtotal_sql and _total_sql.
+    """
     class Meta:
         abstract = True
 
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
+    # Denormalised totals, only ever written by update_totals()
+    subtotal_excl_gst = models.FloatField(default=0.0, editable=False)
+    total_incl_gst = models.FloatField(default=0.0, editable=False)
+
+    _TOTAL_FIELDS = ("subtotal_excl_gst", "total_incl_gst")
+    # Keeps each UPDATE's id list under SQLite's 999 parameter limit
+    _UPDATE_BATCH_SIZE = 500
+
+    # Column on OrderItem pointing back at this kind of order
+    _items_column = None
+    # What each of the order's items contributes to items_subtotal, from OrderItem's columns
+    _item_total_sql = None
+    # subtotal_excl_gst from {items_subtotal} and the {order} row's columns
+    _subtotal_sql = None
+    # total_incl_gst from {subtotal}, {gst} (the GST multiplier) and the {order} row's columns
+    _total_sql = None
+
+    @classmethod
+    def _items_subtotal_sql(cls):
+        """ Correlated sub-query summing _item_total_sql over the items of the outer order row """
+        return (
+            "SELECT COALESCE(SUM({item_total}), 0) FROM {item} "
+            "WHERE {item}.{column} = {order}.id").format(
+                item_total=cls._item_total_sql.format(item=OrderItem._meta.db_table),
+                item=OrderItem._meta.db_table,
+                column=cls._items_column,
+                order=cls._meta.db_table)
+
+    @classmethod
+    def _totals_sql(cls):
+        """ SQL for the (subtotal_excl_gst, total_incl_gst) the outer order row should have """
+        from orders.utils import NZ_GST
+        subtotal = cls._subtotal_sql.format(
+            items_subtotal="(%s)" % cls._items_subtotal_sql(),
+            order=cls._meta.db_table)
+        total = cls._total_sql.format(subtotal="(%s)" % subtotal, gst=NZ_GST, order=cls._meta.db_table)
+        return subtotal, total
+
+    @classmethod
+    def update_totals(cls, queryset):
+        """
+        Recalculate and store the totals of the orders in ``queryset``, with an UPDATE per
+        _UPDATE_BATCH_SIZE orders. Returns {order id: (subtotal_excl_gst, total_incl_gst)}.
+        """
+        ids = list(queryset.values_list('pk', flat=True))
+        subtotal, total = cls._totals_sql()
+        totals = {}
+        cursor = connection.cursor()
+        with transaction.atomic():
+            for start in range(0, len(ids), cls._UPDATE_BATCH_SIZE):
+                batch = ids[start:start + cls._UPDATE_BATCH_SIZE]
+                cursor.execute("UPDATE {order} SET {subtotal_field} = {subtotal}, {total_field} = {total} "
+                               "WHERE id IN ({ids})".format(
+                                   order=cls._meta.db_table,
+                                   subtotal_field=cls._TOTAL_FIELDS[0],
+                                   subtotal=subtotal,
+                                   total_field=cls._TOTAL_FIELDS[1],
+                                   total=total,
+                                   ids=", ".join(["%s"] * len(batch))), batch)
+                totals.update((pk, (s, t)) for pk, s, t in
+                              cls.objects.filter(pk__in=batch).values_list('pk', *cls._TOTAL_FIELDS))
+        return totals
+
+    @classmethod
+    def stale_totals(cls, queryset=None):
+        """ Ids of the orders whose stored totals don't match their items """
+        if queryset is None:
+            queryset = cls.objects.all()
+        subtotal, total = cls._totals_sql()
+        rows = queryset.extra(select={'expected_subtotal': subtotal, 'expected_total': total}).values_list(
+            'pk', 'expected_subtotal', 'expected_total', *cls._TOTAL_FIELDS)
+        return [pk for pk, expected_subtotal, expected_total, stored_subtotal, stored_total in rows
+                if abs(expected_subtotal - stored_subtotal) >= 0.005 or abs(expected_total - stored_total) >= 0.005]
+
+    def refresh_totals(self):
+        totals = self.update_totals(type(self).objects.filter(pk=self.pk))
+        self.subtotal_excl_gst, self.total_incl_gst = totals.get(self.pk, (0.0, 0.0))
+
+    def save(self, *args, **kwargs):
+        # Don't clobber totals updated behind this (possibly stale) instance's back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.local_fields
+                if not f.primary_key and f.name not in self._TOTAL_FIELDS]
+        return super(_BaseOrder, self).save(*args, **kwargs)
 
 
 class SupplierOrder(_BaseOrder):
@@ -127,24 +231,49 @@ class SupplierOrder(_BaseOrder):
         default=STATUS_PENDING)
     supplier = models.ForeignKey(Supplier, related_name="orders", blank=False)
 
+    _items_column = "supplier_order_id"
+    _item_total_sql = "{item}.quantity * {item}.unit_cost * (1 + {item}.surcharge_percentage / 100.0)"
+    _subtotal_sql = "{items_subtotal}"
+    _total_sql = "{subtotal} * {gst}"
+
     @classmethod
     def pending_orders(cls):
         return cls.objects.filter(status=cls.STATUS_PENDING)
 
+    @classmethod
+    def pending_for(cls, supplier_id):
+        """ The pending order for a supplier, created if there isn't one """
+        return cls.pending_orders().get_or_create(supplier_id=supplier_id)[0]
+
     @property
     def total(self):
-        return sum([item.total for item in self.ingredient_orders.all()])
+        """ Total Excluding GST """
+        return self.subtotal_excl_gst
+
+    def summary_rows(self):
+        """
+        The items summed per ingredient, ordered by name, as SummaryRows.
+        Aggregated by the database in a single query.
+        """
+        sql = (
+            "SELECT {ingredient}.id, {ingredient}.name, {ingredient}.unit_size, "
+            "SUM({item}.quantity), SUM({item_total}) "
+            "FROM {item} INNER JOIN {ingredient} ON {ingredient}.id = {item}.ingredient_id "
+            "WHERE {item}.supplier_order_id = %s "
+            "GROUP BY {ingredient}.id, {ingredient}.name, {ingredient}.unit_size "
+            "ORDER BY {ingredient}.name").format(
+                item_total=self._item_total_sql.format(item=OrderItem._meta.db_table),
+                item=OrderItem._meta.db_table,
+                ingredient=Ingredient._meta.db_table)
+        cursor = connection.cursor()
+        cursor.execute(sql, [self.pk])
+        for ingredient_id, name, unit_size, quantity, total in cursor:
+            yield SummaryRow(ingredient_id, name, unit_size, int(quantity), float(total))
 
     @property
     def summary(self):
-        items = {}
-        for item in self.ingredient_orders.all():
-            name = item.ingredient.name
-            quantity, total = items.setdefault(name, (0, 0))
-            quantity += item.quantity
-            total += float(item.total)
-            items[name] = (quantity, total)
-        return items
+        """ {ingredient name: (quantity, total excl. GST)} """
+        return dict((row.name, (row.quantity, row.total)) for row in self.summary_rows())
 
     def supplier_name(self):
         return self.supplier.name
@@ -152,9 +281,9 @@ class SupplierOrder(_BaseOrder):
     def total_excl_gst(self):
         return "$%3.2f" % self.total
 
-    def total_incl_gst(self):
-        from orders.utils import add_gst
-        return "$%3.2f" % add_gst(self.total)
+    def display_total_incl_gst(self):
+        return "$%3.2f" % self.total_incl_gst
+    display_total_incl_gst.short_description = "Total incl gst"
 
     def total_in_unpaid_order_items(self):
         unpaid_order_items = OrderItem.objects.filter(ingredient__supplier=self.supplier)
@@ -166,6 +295,16 @@ class SupplierOrder(_BaseOrder):
         return "%s %d: %s (%s)" % (self.__class__.__name__, self.id, self.supplier.name, self.status)
 
 
+class SummaryRow(namedtuple('SummaryRow', ('ingredient_id', 'name', 'unit_size', 'quantity', 'total'))):
+    """ One ingredient's line in SupplierOrder.summary_rows(), total is excl. GST """
+    @property
+    def quantity_display(self):
+        try:
+            return Ingredient.unit_size_plural(self.unit_size, self.quantity)
+        except Exception:
+            return self.quantity
+
+
 class UserOrder(_BaseOrder):
     STATUS_UNPAID = "unpaid"
     STATUS_PAID = "paid"
@@ -177,11 +316,54 @@ class UserOrder(_BaseOrder):
         blank=False,
         default=STATUS_UNPAID)
     user = models.ForeignKey(get_user_model(), related_name="orders", blank=False)
+    # Surcharges in force when the order was placed
+    surcharge_percentage = models.DecimalField(max_digits=5, decimal_places=2, null=True, editable=False)
+    order_surcharge = models.DecimalField(max_digits=6, decimal_places=2, null=True, editable=False)
+
+    _items_column = "user_order_id"
+    _item_total_sql = "{item}.quantity * {item}.unit_cost"
+    # The surcharges frozen onto the order, see surcharge_factor()
+    _subtotal_sql = "{items_subtotal} * (1 + {order}.surcharge_percentage / 100.0)"
+    _total_sql = "{subtotal} * {gst} + {order}.order_surcharge"
+
+    @classmethod
+    def sync_supplier_orders(cls, user_orders):
+        """
+        Move the items of ``user_orders`` (a queryset or ids) into the pending SupplierOrder
+        for their supplier if the order is paid, or out of pending supplier orders if it
+        isn't. Returns the number of items moved.
+        """
+        items = OrderItem.objects.filter(user_order__in=user_orders)
+        moved = OrderItem.assign_supplier_order(items.filter(
+            user_order__status=cls.STATUS_UNPAID,
+            supplier_order__status=SupplierOrder.STATUS_PENDING), None)
+        unassigned = items.filter(
+            user_order__status=cls.STATUS_PAID,
+            supplier_order=None).exclude(ingredient__supplier=None)
+        supplier_ids = set(unassigned.values_list('ingredient__supplier', flat=True))
+        for supplier_id in supplier_ids:
+            moved += OrderItem.assign_supplier_order(
+                unassigned.filter(ingredient__supplier=supplier_id),
+                SupplierOrder.pending_for(supplier_id))
+        return moved
+
+    def save(self, *args, **kwargs):
+        if self.surcharge_percentage is None:
+            surcharge = Surcharge.current()
+            self.surcharge_percentage = surcharge.surcharge_percentage
+            self.order_surcharge = surcharge.order_surcharge
+        previous_status = None
+        if self.pk is not None:
+            previous_status = UserOrder.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+        result = super(UserOrder, self).save(*args, **kwargs)
+        if self.status != (previous_status or UserOrder.STATUS_UNPAID):
+            UserOrder.sync_supplier_orders([self.pk])
+        return result
 
     @property
     def total(self):
-        from orders.utils import add_gst
-        return add_gst(sum([o.total for o in self.order_items.all()])) + Surcharge.get_order_surcharge()
+        """ Total Including GST and the per order surcharge """
+        return self.total_incl_gst
 
     def username(self):
         return self.user.username
@@ -204,6 +386,65 @@ class OrderItem(models.Model):
         blank=True,
         null=True,
         default=None)
+    # Frozen when the item is ordered
+    unit_cost = models.DecimalField(
+        decimal_places=2,
+        max_digits=5,
+        null=True,
+        editable=False,
+        verbose_name="Unit Cost (NZD) (excl. GST)")
+    surcharge_percentage = models.DecimalField(max_digits=5, decimal_places=2, null=True, editable=False)
+
+    @classmethod
+    def assign_supplier_order(cls, queryset, supplier_order):
+        """
+        Bulk move the items in ``queryset`` into ``supplier_order`` (or out of their supplier
+        order if None), keeping the stored supplier order totals in step.
+        Returns the number of items moved.
+        """
+        affected_ids = set(queryset.exclude(supplier_order=None).values_list('supplier_order', flat=True))
+        count = queryset.update(supplier_order=supplier_order)
+        if supplier_order is not None:
+            affected_ids.add(supplier_order.pk)
+        if count and affected_ids:
+            totals = SupplierOrder.update_totals(SupplierOrder.objects.filter(pk__in=affected_ids))
+            if supplier_order is not None:
+                supplier_order.subtotal_excl_gst, supplier_order.total_incl_gst = totals[supplier_order.pk]
+        return count
+
+    def save(self, *args, **kwargs):
+        previous = None
+        if self.pk is not None:
+            previous = OrderItem.objects.filter(pk=self.pk).values_list(
+                'user_order_id', 'supplier_order_id', 'ingredient_id').first()
+        # Remembered in case the item is being moved, see refresh_order_totals()
+        self._previous_order_ids = previous[:2] if previous else (None, None)
+        if self.unit_cost is None or (previous and previous[2] != self.ingredient_id):
+            self.unit_cost = self.ingredient.unit_cost
+        if self.surcharge_percentage is None:
+            self.surcharge_percentage = self.user_order.surcharge_percentage
+        if (previous is None and self.supplier_order_id is None and
+                self.user_order.status == UserOrder.STATUS_PAID and self.ingredient.supplier_id is not None):
+            # An item added to an order that's already been paid for
+            self.supplier_order = SupplierOrder.pending_for(self.ingredient.supplier_id)
+        return super(OrderItem, self).save(*args, **kwargs)
+
+    def refresh_order_totals(self):
+        """
+        Update the stored totals of the orders this item belongs to, and of any it has
+        just been moved out of.
+        """
+        previous_ids = getattr(self, '_previous_order_ids', (None, None))
+        for field_name, previous_id in zip(("user_order", "supplier_order"), previous_ids):
+            field = self._meta.get_field(field_name)
+            order_ids = set([getattr(self, field.attname), previous_id]) - set([None])
+            if not order_ids:
+                continue
+            totals = field.rel.to.update_totals(field.rel.to.objects.filter(pk__in=order_ids))
+            cached_order = getattr(self, field.get_cache_name(), None)
+            if cached_order is not None and cached_order.pk in totals:
+                cached_order.subtotal_excl_gst, cached_order.total_incl_gst = totals[cached_order.pk]
+        self._previous_order_ids = (None, None)
 
     def __str__(self):
         return "%s, %s, tot: $%2.2f" % (
@@ -217,8 +458,8 @@ class OrderItem(models.Model):
 
     @property
     def total(self):
-        """ Total Excluding GST """
-        return self.quantity * self.ingredient.unit_cost_excl_gst_incl_surcharge
+        """ Total Excluding GST, at the prices when it was ordered """
+        return self.quantity * float(self.unit_cost) * surcharge_factor(self.surcharge_percentage)
 
     def username(self):
         return self.user_order.username()
@@ -226,9 +467,6 @@ class OrderItem(models.Model):
     def unit_size(self):
         return self.ingredient.unit_size
 
-    def unit_cost(self):
-        return self.ingredient.unit_cost
-
     def paid(self):
         return self.user_order.status
 
@@ -241,12 +479,24 @@ class OrdersEnabled(models.Model):
     """
     enabled = models.BooleanField(blank=False, null=False, default=False)
 
+    CACHE_KEY = "orders:enabled"
+    CACHE_TIMEOUT = 30
+
     class Meta:
         verbose_name_plural = 'Orders Enabled'
 
     @classmethod
     def is_enabled(cls):
-        return cls.objects.get_or_create(id=1)[0].enabled
+        """ Cached for up to CACHE_TIMEOUT seconds, or until the flag is saved or deleted """
+        enabled = cache.get(cls.CACHE_KEY)
+        if enabled is None:
+            enabled = cls.objects.get_or_create(id=1)[0].enabled
+            cache.set(cls.CACHE_KEY, enabled, cls.CACHE_TIMEOUT)
+        return enabled
+
+    @classmethod
+    def invalidate_cache(cls):
+        cache.delete(cls.CACHE_KEY)
 
     def save(self, *args, **kwargs):
         self.id = 1
@@ -259,16 +509,128 @@ class Surcharge(models.Model):
     order_surcharge = models.DecimalField(max_digits=6, decimal_places=2, blank=False, null=False,
                                           default=0.0, help_text="Surcharge in $ per order on top of percentage cut")
 
+    @classmethod
+    def current(cls):
+        """
+        The surcharge settings, held in process memory until a Surcharge is saved
+        (in any worker process). Note: queryset.update() bypasses the invalidation.
+        """
+        return _current_surcharge.get()
+
+    @classmethod
+    def _load(cls):
+        """
+        The settings row, created with the defaults if there isn't one yet. It's created with
+        bulk_create() so post_save isn't sent. The defaults don't change anything derived
+        from the surcharge, and invalidating the catalog here would happen partway through
+        building a catalog snapshot.
+        """
+        surcharge = cls.objects.filter(id=1).first()
+        if surcharge is None:
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create([cls(id=1)])
+            except IntegrityError:
+                # Created by another process meanwhile
+                pass
+            surcharge = cls.objects.get(id=1)
+        return surcharge
+
+    @classmethod
+    def invalidate_cache(cls):
+        _current_surcharge.invalidate()
+
     @classmethod
     def get_surcharge_percentage(cls):
-        surcharge, _ = cls.objects.get_or_create(id=1)
-        return float(surcharge.surcharge_percentage)
+        return float(cls.current().surcharge_percentage)
 
     @classmethod
     def get_factor(cls):
-        return 1 + cls.get_surcharge_percentage() / 100
+        return surcharge_factor(cls.get_surcharge_percentage())
 
     @classmethod
     def get_order_surcharge(cls):
-        surcharge, _ = cls.objects.get_or_create(id=1)
-        return float(surcharge.order_surcharge)
+        return float(cls.current().order_surcharge)
+
+
+class OutgoingEmail(models.Model):
+    """
+    Order mail waiting to be sent by the send_queued_email command. Queueing a message
+    with a key that's already in the outbox does nothing, so it's sent once per key.
+    """
+    ACCOUNT_DEFAULT = "default"
+    ACCOUNT_ORDERS = "orders"
+    STATUS_QUEUED = "queued"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    key = models.CharField(max_length=100, unique=True)
+    account = models.CharField(
+        max_length=10,
+        choices=(
+            (ACCOUNT_DEFAULT, "default mail account"),
+            (ACCOUNT_ORDERS, "orders mail account")),
+        default=ACCOUNT_DEFAULT)
+    from_email = models.CharField(max_length=254, blank=True, help_text="Blank for DEFAULT_FROM_EMAIL")
+    recipients = models.TextField(help_text="Comma separated")
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(
+        max_length=10,
+        choices=(
+            (STATUS_QUEUED, "queued"),
+            (STATUS_SENDING, "being sent"),
+            (STATUS_SENT, "sent"),
+            (STATUS_FAILED, "failed, gave up retrying")),
+        default=STATUS_QUEUED,
+        db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    # When a send_queued_email run marked it as being sent
+    claimed = models.DateTimeField(null=True, blank=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def queue(cls, key, subject, body, recipients, from_email="", account=ACCOUNT_DEFAULT):
+        """ Add a message to the outbox unless one with the same key is already there """
+        return cls.objects.get_or_create(key=key, defaults=dict(
+            subject=subject,
+            body=body,
+            recipients=",".join(recipients),
+            from_email=from_email,
+            account=account))[0]
+
+    @classmethod
+    def connection_kwargs(cls, account):
+        """ Arguments for mail.get_connection() to send as the given account """
+        from django.conf import settings
+        if account == cls.ACCOUNT_ORDERS:
+            return dict(username=settings.ORDER_EMAIL_HOST_USER, password=settings.ORDER_EMAIL_HOST_PASSWORD)
+        return {}
+
+    def message(self, connection=None):
+        from django.core import mail
+        return mail.EmailMessage(
+            self.subject,
+            self.body,
+            self.from_email or None,
+            self.recipients.split(","),
+            connection=connection)
+
+    def __str__(self):
+        return "%s %s (%s)" % (self.__class__.__name__, self.key, self.status)
+
+
+_current_surcharge = VersionedMemo("orders.surcharge", Surcharge._load)
+
+
+for sender in (Supplier, Ingredient, Grain, Hop):
+    post_save.connect(signals.catalog_changed, sender=sender, dispatch_uid="%s_saved_catalog" % sender.__name__)
+    post_delete.connect(signals.catalog_changed, sender=sender, dispatch_uid="%s_deleted_catalog" % sender.__name__)
+post_save.connect(signals.order_item_changed, sender=OrderItem, dispatch_uid="order_item_saved_totals")
+post_delete.connect(signals.order_item_changed, sender=OrderItem, dispatch_uid="order_item_deleted_totals")
+post_save.connect(signals.orders_enabled_changed, sender=OrdersEnabled, dispatch_uid="orders_enabled_saved")
+post_delete.connect(signals.orders_enabled_changed, sender=OrdersEnabled, dispatch_uid="orders_enabled_deleted")
+post_save.connect(signals.surcharge_saved, sender=Surcharge, dispatch_uid="surcharge_saved")
+post_delete.connect(signals.surcharge_saved, sender=Surcharge, dispatch_uid="surcharge_deleted")
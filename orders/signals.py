@@ -1,7 +1,8 @@
 import logging
 from django.conf import settings
-from django.core import mail
-from flatblocks.models import FlatBlock
+from django.db import transaction
+from django.utils import timezone
+from main import blocks
 
 
 def order_paid(sender, **kwargs):
@@ -14,29 +15,58 @@ def order_paid(sender, **kwargs):
         log.error("Invalid invoice id: %s" % ipn_obj.invoice)
         return
     log.info("payment success, order #%d" % user_order_id)
-    if models.UserOrder.objects.filter(
+    # PayPal can repeat an IPN, only the first one for an order gets past the status check
+    with transaction.atomic():
+        paid = models.UserOrder.objects.filter(
             id=user_order_id,
-            status=models.UserOrder.STATUS_PAID).count() > 0:
-        log.error("UserOrder #%d already paid!" % user_order_id)
+            status=models.UserOrder.STATUS_UNPAID).update(status=models.UserOrder.STATUS_PAID, modified=timezone.now())
+        if paid:
+            models.UserOrder.sync_supplier_orders([user_order_id])
+    if not paid:
+        if models.UserOrder.objects.filter(id=user_order_id).exists():
+            log.error("UserOrder #%d already paid!" % user_order_id)
+        else:
+            log.error("No UserOrder with id: %d" % user_order_id)
+        return
+    # The payment stands whether or not the email can be queued
     try:
-        user_order = models.UserOrder.objects.get(id=user_order_id)
-        user_order.status = models.UserOrder.STATUS_PAID
-        user_order.save()
-        _email_order_confirmation(user_order)
-    except models.UserOrder.DoesNotExist:
-        log.error("No UserOrder with id: %d" % user_order_id)
+        with transaction.atomic():
+            _queue_order_confirmation(models.UserOrder.objects.select_related('user').get(id=user_order_id))
+    except Exception:
+        log.exception("Couldn't queue the confirmation email for order #%d" % user_order_id)
+
+
+def order_item_changed(sender, instance, **kwargs):
+    """ Keep the stored order totals in step with the items in them """
+    instance.refresh_order_totals()
+
+
+def orders_enabled_changed(sender, **kwargs):
+    from orders import models
+    models.OrdersEnabled.invalidate_cache()
 
 
-def _email_order_confirmation(user_order):
-    message = FlatBlock.objects.get(slug='orders.email.confirmation').content % dict(
+def surcharge_saved(sender, **kwargs):
+    from orders import catalog, models
+    models.Surcharge.invalidate_cache()
+    catalog.invalidate()
+
+
+def catalog_changed(sender, **kwargs):
+    from orders import catalog
+    catalog.invalidate()
+
+
+def _queue_order_confirmation(user_order):
+    from orders import models
+    message = blocks.get('orders.email.confirmation').content % dict(
         order_number=user_order.id,
         total=user_order.total,
     )
-    mail.send_mail(
+    models.OutgoingEmail.queue(
+        "order-paid-%d" % user_order.id,
         'Your UCBC Order #%d' % user_order.id,
         message,
-        settings.ORDER_FROM_EMAIL,
         [user_order.user.email, settings.ORDER_FROM_EMAIL],
-        fail_silently=True,
-        auth_user=settings.ORDER_EMAIL_HOST_USER,
-        auth_password=settings.ORDER_EMAIL_HOST_PASSWORD)
+        from_email=settings.ORDER_FROM_EMAIL,
+        account=models.OutgoingEmail.ACCOUNT_ORDERS)
@@ -1,10 +1,127 @@
 """https://djangosnippets.org/snippets/552/"""
 from django import template
 import locale
-locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+import threading
 register = template.Library()
 from orders import utils
 
+DEFAULT_LOCALE = 'en_US.UTF-8'
+# localeconv() value meaning "not specified"
+CHAR_MAX = 127
+
+
+def _grouping_intervals(grouping):
+    last_interval = None
+    for interval in grouping:
+        if interval == CHAR_MAX:
+            return
+        if interval == 0:
+            while True:
+                yield last_interval
+        yield interval
+        last_interval = interval
+
+
+class CurrencyFormat(object):
+    """
+    locale.currency(value, symbol, grouping=True) for the monetary conventions ``conv``
+    (a localeconv() dict), without setting the process's locale. Where the symbol and
+    sign go is worked out once, up front.
+    """
+    def __init__(self, conv):
+        self.digits = conv['frac_digits']
+        self.decimal_point = conv['mon_decimal_point']
+        self.thousands_sep = conv['mon_thousands_sep']
+        self.grouping = conv['mon_grouping']
+        self.affixes = dict(((symbol, negative), self._affixes(conv, symbol, negative))
+                            for symbol in (True, False) for negative in (True, False))
+
+    @staticmethod
+    def _affixes(conv, symbol, negative):
+        """ The (prefix, suffix) around the number, placed as locale.currency() places them """
+        p_or_n = 'n_' if negative else 'p_'
+        # < and > mark where the sign goes if it's between the symbol and the number
+        s = '<\0>'
+        if symbol:
+            separator = ' ' if conv[p_or_n + 'sep_by_space'] else ''
+            if conv[p_or_n + 'cs_precedes']:
+                s = conv['currency_symbol'] + separator + s
+            else:
+                s = s + separator + conv['currency_symbol']
+        sign = conv['negative_sign' if negative else 'positive_sign']
+        position = conv[p_or_n + 'sign_posn']
+        if position == 0:
+            s = '(' + s + ')'
+        elif position == 2:
+            s = s + sign
+        elif position == 3:
+            s = s.replace('<', sign)
+        elif position == 4:
+            s = s.replace('>', sign)
+        else:
+            s = sign + s
+        return tuple(s.replace('<', '').replace('>', '').split('\0'))
+
+    def _group(self, number):
+        groups, left = [], ''
+        for interval in _grouping_intervals(self.grouping):
+            if not number or number[-1] not in '0123456789':
+                left, number = number, ''
+                break
+            groups.append(number[-interval:])
+            number = number[:-interval]
+        if number:
+            groups.append(number)
+        return left + self.thousands_sep.join(reversed(groups))
+
+    def format(self, value, symbol=True):
+        if self.digits == CHAR_MAX:
+            raise ValueError("Currency formatting is not possible using the 'C' locale.")
+        parts = ('%.*f' % (self.digits, abs(value))).split('.')
+        parts[0] = self._group(parts[0])
+        prefix, suffix = self.affixes[bool(symbol), value < 0]
+        return prefix + self.decimal_point.join(parts) + suffix
+
+
+_formats = {DEFAULT_LOCALE: CurrencyFormat({
+    'currency_symbol': '$',
+    'frac_digits': 2,
+    'mon_decimal_point': '.',
+    'mon_grouping': [3, 3, 0],
+    'mon_thousands_sep': ',',
+    'n_cs_precedes': 1,
+    'n_sep_by_space': 0,
+    'n_sign_posn': 1,
+    'negative_sign': '-',
+    'p_cs_precedes': 1,
+    'p_sep_by_space': 0,
+    'p_sign_posn': 1,
+    'positive_sign': '',
+})}
+_formats_lock = threading.Lock()
+
+
+def currency_format(name):
+    """
+    The CurrencyFormat for locale ``name``, or None if the system doesn't have it. Other
+    than en_US, the conventions are read from the system's locale data the first time.
+    """
+    try:
+        return _formats[name]
+    except KeyError:
+        pass
+    with _formats_lock:
+        if name not in _formats:
+            saved = locale.setlocale(locale.LC_MONETARY)
+            try:
+                locale.setlocale(locale.LC_MONETARY, name)
+                _formats[name] = CurrencyFormat(locale.localeconv())
+            except locale.Error:
+                _formats[name] = None
+            finally:
+                locale.setlocale(locale.LC_MONETARY, saved)
+        return _formats[name]
+
 
 # https://djangosnippets.org/snippets/1825/
 @register.filter
@@ -20,7 +137,7 @@ def currency(value, arg = '', symbol = True):
       * {{ value|currency:"pt_BR" }}
       * {{ value|currency:"pt_BR.UTF8" }}
 
-    If the argument is omitted, the default system locale will be used.
+    If the argument is omitted, en_US is used.
 
     The third parameter, symbol, controls whether the currency symbol will be
     printed or not. Defaults to true.
@@ -29,34 +146,17 @@ def currency(value, arg = '', symbol = True):
     exceptions caused by wrong types or invalid locale arguments. It will
     return an empty string instead.
 
-    Be aware that currency formatting is not possible using the 'C' locale.
-    This function will fall back to 'en_US.UTF8' in this case.
+    The process's locale is never changed, see CurrencyFormat.
     '''
-
-    saved = '.'.join([x for x in locale.getlocale() if x]) or (None, None)
-    given = arg and ('.' in arg and str(arg) or str(arg) + '.UTF-8')
-
-    # Workaround for Python bug 1699853 and other possibly related bugs.
-    if '.' in saved and saved.split('.')[1].lower() in ('utf', 'utf8'):
-        saved = saved.split('.')[0] + '.UTF-8'
-
-    if saved == (None, None) and given == '':
-        given = 'en_US.UTF-8'
-
-    if given == '':
-        given = None
-
+    given = arg and ('.' in arg and str(arg) or str(arg) + '.UTF-8') or DEFAULT_LOCALE
+    formatter = currency_format(given)
+    if formatter is None:
+        return ''
     try:
-        locale.setlocale(locale.LC_ALL, given)
-
-        return locale.currency(value or 0, symbol, True)
-
-    except (TypeError, locale.Error):
+        return formatter.format(value or 0, symbol)
+    except (TypeError, ValueError):
         return ''
 
-    finally:
-        locale.setlocale(locale.LC_ALL, saved)
-
 
 @register.filter()
 def add_gst(amount):
@@ -66,4 +166,3 @@ def add_gst(amount):
         return ''
     except ValueError:
         return ''
-
@@ -0,0 +1,66 @@
+from django.core.cache import get_cache
+from django.test import TestCase
+import mock
+from nose.tools import assert_is, assert_is_not, assert_equal
+from orders import catalog
+from orders.models import Supplier, Grain, Surcharge
+
+
+class TestFormsetClass(TestCase):
+    def setUp(self):
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='catalog-tests')
+        cache.clear()
+        self.cache_patch = mock.patch('main.cache.cache', cache)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+
+    def test_cached_per_size(self):
+        formset_class = catalog.formset_class(3)
+        assert_equal(3, formset_class.max_num)
+        assert_is(formset_class, catalog.formset_class(3))
+        assert_is_not(formset_class, catalog.formset_class(4))
+
+    def test_rebuilt_when_catalog_changes(self):
+        formset_class = catalog.formset_class(3)
+        Grain.objects.create(name="Munich", unit_cost=2, unit_size="sack",
+                             supplier=Supplier.objects.create(name="Gladfields"))
+        assert_is_not(formset_class, catalog.formset_class(3))
+
+
+class TestSnapshot(TestCase):
+    def setUp(self):
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='catalog-tests')
+        cache.clear()
+        self.cache_patch = mock.patch('main.cache.cache', cache)
+        self.cache_patch.start()
+        self.gladfields = Supplier.objects.create(name="Gladfields")
+        self.munich = Grain.objects.create(name="Munich", unit_cost=36, unit_size="sack", supplier=self.gladfields)
+
+    def tearDown(self):
+        self.cache_patch.stop()
+
+    def snapshot(self):
+        return catalog.snapshot("test", Grain.objects.filter(supplier__name="Gladfields"))
+
+    def test_rows(self):
+        surcharge, _ = Surcharge.objects.get_or_create(id=1)
+        surcharge.surcharge_percentage = 10
+        surcharge.save()
+        assert_equal([("Munich", 36 * 1.1, "sack")], self.snapshot())
+
+    def test_default_surcharge_doesnt_invalidate(self):
+        assert_equal(0, Surcharge.objects.count())
+        self.snapshot()
+        assert_equal(1, Surcharge.objects.count())
+        with self.assertNumQueries(0):
+            self.snapshot()
+
+    def test_cached_until_catalog_changes(self):
+        self.snapshot()
+        with self.assertNumQueries(0):
+            assert_equal([("Munich", 36.0, "sack")], self.snapshot())
+        self.munich.unit_cost = 40
+        self.munich.save()
+        assert_equal([("Munich", 40.0, "sack")], self.snapshot())
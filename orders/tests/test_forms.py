@@ -1,8 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from nose.tools import assert_equal
-from orders.forms import SupplierOrderAdminForm
+from orders.forms import CartFormset, SupplierOrderAdminForm
 from orders.models import Supplier, Grain, Ingredient, Hop, UserOrder, OrderItem, SupplierOrder
+from orders.utils import add_gst
 
 
 class TestSupplierOrderAdminForm(TestCase):
@@ -40,3 +41,39 @@ class TestSupplierOrderAdminForm(TestCase):
         assert_equal(supplier_order.supplier, supplier)
         assert_equal(supplier_order.ingredient_orders.get(id=item1.id), item1)
         assert_equal(supplier_order.ingredient_orders.get(id=item2.id), item2)
+
+
+class TestCartFormset(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.munich = Grain.objects.create(name="Munich", unit_cost=36, unit_size="sack")
+        self.saaz = Hop.objects.create(name="Saaz", unit_cost=10, unit_size="100g")
+
+    def formset(self, *lines):
+        data = {
+            'cart-TOTAL_FORMS': str(len(lines)),
+            'cart-INITIAL_FORMS': str(len(lines)),
+            'cart-MAX_NUM_FORMS': '1000',
+        }
+        for i, (ingredient_id, quantity) in enumerate(lines):
+            data['cart-%d-ingredient' % i] = str(ingredient_id)
+            data['cart-%d-quantity' % i] = str(quantity)
+        return CartFormset(data=data, instance=UserOrder(user=self.user), prefix="cart")
+
+    def test_save(self):
+        formset = self.formset((self.munich.id, 2), (self.saaz.id, 3))
+        with self.assertNumQueries(1):
+            self.assertTrue(formset.is_valid())
+        user_order = formset.save()
+        assert_equal(
+            sorted(user_order.order_items.values_list('ingredient__name', 'quantity', 'unit_cost')),
+            [("Munich", 2, 36), ("Saaz", 3, 10)])
+        assert_equal(UserOrder.objects.get(id=user_order.id).total, add_gst(36 * 2 + 10 * 3))
+
+    def test_unknown_ingredient_saves_nothing(self):
+        formset = self.formset((self.munich.id, 2), (self.saaz.id + 1000, 3))
+        self.assertFalse(formset.is_valid())
+        assert_equal(UserOrder.objects.count(), 0)
+
+    def test_empty(self):
+        self.assertFalse(self.formset().is_valid())
@@ -0,0 +1,109 @@
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from nose.tools import assert_equal
+from orders.importers import IngredientImporter, RowError, Change
+from orders.models import Supplier, Grain, Hop, OrderItem, UserOrder
+
+
+def csv_lines(*rows):
+    yield b"name,unit_cost,unit_size,supplier_name\n"
+    for row in rows:
+        yield (",".join(str(value) for value in row) + "\n").encode('utf-8')
+
+
+class TestIngredientImporter(TestCase):
+    def setUp(self):
+        self.gladfields = Supplier.objects.create(name="Gladfields")
+
+    def test_created(self):
+        result = IngredientImporter(Grain).run(csv_lines(
+            ("Munich", "36", "sack", "Gladfields"),
+            ("Wheat", "2.5", "Kg", "Gladfields")))
+        assert_equal((["Munich", "Wheat"], [], []), (result.created, result.updated, result.errors))
+        munich = Grain.objects.get(name="Munich")
+        assert_equal((Decimal("36"), "sack", self.gladfields), (munich.unit_cost, munich.unit_size, munich.supplier))
+        assert_equal(Decimal("2.5"), Grain.objects.get(name="Wheat").unit_cost)
+
+    def test_lines_split_across_chunks(self):
+        content = b"".join(csv_lines(("Munich", "36", "sack", "Gladfields"), ("Wheat", "2.5", "Kg", "Gladfields")))
+        result = IngredientImporter(Grain).run(content[i:i + 7] for i in range(0, len(content), 7))
+        assert_equal((["Munich", "Wheat"], []), (result.created, result.errors))
+
+    def test_byte_order_mark(self):
+        header = b"\xef\xbb\xbfname,unit_cost,unit_size,supplier_name\nMunich,36,sack,Gladfields\n"
+        assert_equal(["Munich"], IngredientImporter(Grain).run([header]).created)
+
+    def test_updated_and_unchanged(self):
+        Grain.objects.create(name="Munich", unit_cost=36, unit_size="sack", supplier=self.gladfields)
+        Grain.objects.create(name="Wheat", unit_cost=2, unit_size="Kg", supplier=self.gladfields)
+        result = IngredientImporter(Grain).run(csv_lines(
+            ("Munich", "38", "sack", "Gladfields"),
+            ("Wheat", "2", "Kg", "Gladfields")))
+        assert_equal(([], ["Munich"], 1), (result.created, [c.name for c in result.updated], result.unchanged))
+        assert_equal(Decimal("38"), Grain.objects.get(name="Munich").unit_cost)
+
+    def test_bad_rows_reported_and_skipped(self):
+        Hop.objects.create(name="Saaz", unit_cost=10, unit_size="100g", supplier=self.gladfields)
+        result = IngredientImporter(Grain).run(csv_lines(
+            ("Munich", "36", "sack", "bad supplier"),
+            ("Wheat", "cheap", "Kg", "Gladfields"),
+            ("Pilsener", "30", "bad unit size", "Gladfields"),
+            ("Saaz", "10", "100g", "Gladfields"),
+            ("Vienna", "33", "sack", "Gladfields")))
+        assert_equal([
+            RowError(2, "Unknown supplier: 'bad supplier'"),
+            RowError(3, "Invalid unit cost: 'cheap'"),
+            RowError(4, "Unknown unit size: 'bad unit size'"),
+            RowError(5, "Saaz already exists and isn't a grain"),
+        ], result.errors)
+        assert_equal(["Vienna"], list(Grain.objects.values_list('name', flat=True)))
+
+    def test_batches(self):
+        importer = IngredientImporter(Grain)
+        importer.BATCH_SIZE = importer.UPDATE_BATCH_SIZE = 2
+        Grain.objects.create(name="Grain 0", unit_cost=1, unit_size="Kg", supplier=self.gladfields)
+        Grain.objects.create(name="Grain 1", unit_cost=1, unit_size="Kg", supplier=self.gladfields)
+        Grain.objects.create(name="Grain 2", unit_cost=1, unit_size="Kg", supplier=self.gladfields)
+        importer.run(csv_lines(*[("Grain %d" % i, i + 2, "Kg", "Gladfields") for i in range(5)]))
+        assert_equal((2, 3), (len(importer.created), len(importer.updated)))
+        assert_equal(
+            [Decimal(i + 2) for i in range(5)],
+            list(Grain.objects.order_by('name').values_list('unit_cost', flat=True)))
+
+    def test_reimport_only_writes_changes(self):
+        rows = [("Munich", "36", "sack", "Gladfields"), ("Wheat", "2.5", "Kg", "Gladfields")]
+        IngredientImporter(Grain).run(csv_lines(*rows))
+        result = IngredientImporter(Grain).run(csv_lines(("Munich", "37", "sack", "Gladfields"), rows[1]))
+        assert_equal(([], 1), (result.created, result.unchanged))
+        assert_equal(
+            [Change("Munich", (Decimal("36"), "sack", "Gladfields"), (Decimal("37"), "sack", "Gladfields"))],
+            result.updated)
+
+    def test_edited_since_import_compared_by_value(self):
+        IngredientImporter(Grain).run(csv_lines(("Munich", "36", "sack", "Gladfields")))
+        munich = Grain.objects.get(name="Munich")
+        munich.unit_cost = 40
+        munich.save()
+        result = IngredientImporter(Grain).run(csv_lines(("Munich", "36", "sack", "Gladfields")))
+        assert_equal(["Munich"], [c.name for c in result.updated])
+        assert_equal(Decimal("36"), Grain.objects.get(name="Munich").unit_cost)
+
+    def test_dry_run(self):
+        Grain.objects.create(name="Munich", unit_cost=36, unit_size="sack", supplier=self.gladfields)
+        result = IngredientImporter(Grain, remove_missing=True, dry_run=True).run(csv_lines(
+            ("Wheat", "2.5", "Kg", "Gladfields")))
+        assert_equal((["Wheat"], ["Munich"]), (result.created, result.removed))
+        assert_equal(["Munich"], list(Grain.objects.values_list('name', flat=True)))
+
+    def test_remove_missing_keeps_ordered(self):
+        munich = Grain.objects.create(name="Munich", unit_cost=36, unit_size="sack", supplier=self.gladfields)
+        Grain.objects.create(name="Vienna", unit_cost=33, unit_size="sack", supplier=self.gladfields)
+        Grain.objects.create(name="Pale", unit_cost=30, unit_size="sack", supplier=Supplier.objects.create(name="Cryer"))
+        OrderItem.objects.create(
+            ingredient=munich,
+            quantity=1,
+            user_order=UserOrder.objects.create(user=get_user_model().objects.create(username="bob")))
+        result = IngredientImporter(Grain, remove_missing=True).run(csv_lines(("Wheat", "2.5", "Kg", "Gladfields")))
+        assert_equal((["Vienna"], ["Munich"]), (result.removed, result.kept))
+        assert_equal(["Munich", "Pale", "Wheat"], list(Grain.objects.order_by('name').values_list('name', flat=True)))
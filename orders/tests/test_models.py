@@ -1,12 +1,23 @@
+from datetime import timedelta
+from decimal import Decimal
 from functools import partial
+from io import StringIO
 import random
 from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import get_cache
+from django.core.management import call_command
 from django.db import IntegrityError
-from django.test import TestCase
+from django.template import RequestContext, Template
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+import mock
 from nose.tools import assert_equal, raises
 from paypal.standard.ipn.signals import payment_was_successful
-from orders.models import Ingredient, OrdersEnabled, OrderItem, UserOrder, SupplierOrder, Supplier, Grain, Hop, Surcharge
+from orders.models import Ingredient, OrdersEnabled, OrderItem, UserOrder, SupplierOrder, Supplier, Grain, Hop, Surcharge, \
+    OutgoingEmail
 from orders.utils import add_gst
+from main.cache import VersionStamp
 
 User = get_user_model()
 
@@ -77,6 +88,33 @@ class TestOrdersEnabled(TestCase):
         self.assertFalse(OrdersEnabled.is_enabled())
         assert_equal(1, OrdersEnabled.objects.count())
 
+    @mock.patch('orders.models.cache', get_cache('django.core.cache.backends.locmem.LocMemCache',
+                                                 LOCATION='orders-enabled-tests'))
+    def test_is_enabled_cached_until_saved(self):
+        from orders.models import cache
+        cache.clear()
+        flag = OrdersEnabled.objects.create(enabled=False)
+        self.assertFalse(OrdersEnabled.is_enabled())
+        with self.assertNumQueries(0):
+            self.assertFalse(OrdersEnabled.is_enabled())
+        flag.enabled = True
+        flag.save()
+        self.assertTrue(OrdersEnabled.is_enabled())
+        flag.delete()
+        self.assertFalse(OrdersEnabled.is_enabled())
+
+    @mock.patch('orders.models.cache', get_cache('django.core.cache.backends.locmem.LocMemCache',
+                                                 LOCATION='orders-enabled-context-tests'))
+    def test_context_processor(self):
+        from orders.models import cache
+        cache.clear()
+        OrdersEnabled.objects.create(enabled=True)
+        template = Template("{% if orders_enabled %}Taking orders{% endif %}")
+        context = RequestContext(RequestFactory().get('/'))
+        assert_equal("Taking orders", template.render(context))
+        with self.assertNumQueries(0):
+            assert_equal("Taking orders", template.render(RequestContext(RequestFactory().get('/'))))
+
 
 def create_order_item(order, supplier, unit_cost=1.0, quantity=1, supplier_order=None, name=None):
     if not name:
@@ -121,6 +159,21 @@ class TestUserOrder(TestCase):
         total += 11.80
         assert_equal(total, order.total)
 
+    def test_stored_totals_single_query(self):
+        supplier = Supplier.objects.create(name="testsupplier")
+        user = User.objects.create_user("b")
+        for unit_cost, quantity in ((3.5, 2), (2.1, 5), (7, 1)):
+            order = UserOrder.objects.create(user=user)
+            create_order_item(order, supplier, unit_cost=unit_cost, quantity=quantity)
+            create_order_item(order, supplier, unit_cost=1, quantity=3)
+        with self.assertNumQueries(1):
+            totals = [o.total for o in UserOrder.objects.order_by('id')]
+        assert_equal([add_gst(10.0), add_gst(13.5), add_gst(10.0)], totals)
+
+    def test_total_no_items(self):
+        order = UserOrder.objects.create(user=User.objects.create_user("b"))
+        assert_equal(0.0, order.total)
+
 
 class TestSupplierOrder(TestCase):
     def test_supplier_order_total_gst_excl(self):
@@ -134,6 +187,7 @@ class TestSupplierOrder(TestCase):
         create_order_item(order, supplier, unit_cost=3, quantity=5, supplier_order=supplier_order)
         create_order_item(order, supplier, unit_cost=1, quantity=7, supplier_order=supplier_order)
         assert_equal(22, supplier_order.total)
+        assert_equal(22, SupplierOrder.objects.get(id=supplier_order.id).total)
 
     def test_summary(self):
         supplier = Supplier.objects.create(name="testsupplier")
@@ -157,6 +211,105 @@ class TestSupplierOrder(TestCase):
             },
             supplier_order.summary)
 
+    def test_summary_rows(self):
+        supplier = Supplier.objects.create(name="testsupplier")
+        supplier_order = SupplierOrder.objects.create(supplier=supplier)
+        order = UserOrder.objects.create(user=User.objects.create_user("c"))
+        munich = create_order_item(order, supplier, unit_cost=3, quantity=5, supplier_order=supplier_order, name="Munich")
+        create_order_item(order, supplier, unit_cost=3, quantity=7, supplier_order=supplier_order, name="Munich")
+        create_order_item(order, supplier, unit_cost=1, quantity=7, supplier_order=supplier_order, name="Wheat")
+        Ingredient.objects.filter(name="Munich").update(unit_size="sack")
+        with self.assertNumQueries(1):
+            rows = list(supplier_order.summary_rows())
+        wheat_id = Ingredient.objects.get(name="Wheat").id
+        assert_equal([(munich.ingredient_id, "Munich", "sack", 12, 36.0), (wheat_id, "Wheat", None, 7, 7.0)], rows)
+        assert_equal(["12 sacks", 7], [row.quantity_display for row in rows])
+
+
+class TestStoredTotals(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(name="testsupplier")
+        self.user_order = UserOrder.objects.create(user=User.objects.create_user("e"))
+        self.supplier_order = SupplierOrder.objects.create(supplier=self.supplier)
+        self.item1 = create_order_item(self.user_order, self.supplier, unit_cost=3, quantity=5)
+        self.item2 = create_order_item(self.user_order, self.supplier, unit_cost=1, quantity=7)
+
+    def stored(self, model, order):
+        return model.objects.values_list('subtotal_excl_gst', 'total_incl_gst').get(id=order.id)
+
+    def test_item_created_and_deleted(self):
+        assert_equal((22, add_gst(22)), self.stored(UserOrder, self.user_order))
+        self.item1.delete()
+        assert_equal((7, add_gst(7)), self.stored(UserOrder, self.user_order))
+
+    def test_item_changed(self):
+        self.item2.quantity = 1
+        self.item2.save()
+        assert_equal((16, add_gst(16)), self.stored(UserOrder, self.user_order))
+
+    def test_ingredient_price_change_doesnt_affect_orders(self):
+        ingredient = self.item1.ingredient
+        ingredient.unit_cost = 4
+        ingredient.save()
+        assert_equal((22, add_gst(22)), self.stored(UserOrder, self.user_order))
+        assert_equal(15, OrderItem.objects.get(id=self.item1.id).total)
+
+    def test_moved_between_supplier_orders(self):
+        other = SupplierOrder.objects.create(supplier=self.supplier)
+        OrderItem.assign_supplier_order(OrderItem.objects.all(), self.supplier_order)
+        assert_equal((22, add_gst(22)), self.stored(SupplierOrder, self.supplier_order))
+        self.item1.supplier_order = other
+        self.item1.save()
+        assert_equal((7, add_gst(7)), self.stored(SupplierOrder, self.supplier_order))
+        assert_equal((15, add_gst(15)), self.stored(SupplierOrder, other))
+        OrderItem.assign_supplier_order(OrderItem.objects.filter(id=self.item2.id), None)
+        assert_equal((0, 0), self.stored(SupplierOrder, self.supplier_order))
+
+    def test_surcharge_change_doesnt_affect_orders(self):
+        surcharge, _ = Surcharge.objects.get_or_create(id=1)
+        surcharge.surcharge_percentage = 10
+        surcharge.order_surcharge = 5
+        surcharge.save()
+        assert_equal([], UserOrder.stale_totals())
+        assert_equal(add_gst(22), UserOrder.objects.get(id=self.user_order.id).total)
+
+    def test_prices_frozen_when_ordered(self):
+        Surcharge.objects.filter(id=1).update(surcharge_percentage=10, order_surcharge=5)
+        Surcharge.invalidate_cache()
+        order = UserOrder.objects.create(user=User.objects.create_user("f"))
+        item = create_order_item(order, self.supplier, unit_cost=2, quantity=3)
+        assert_equal((Decimal('10'), Decimal('5')), (order.surcharge_percentage, order.order_surcharge))
+        assert_equal((Decimal('2'), Decimal('10')), (item.unit_cost, item.surcharge_percentage))
+        assert_equal(add_gst(6 * 1.1) + 5, UserOrder.objects.get(id=order.id).total)
+
+    def test_changing_ingredient_reprices_item(self):
+        self.item1.ingredient = self.item2.ingredient
+        self.item1.save()
+        assert_equal(1, OrderItem.objects.get(id=self.item1.id).unit_cost)
+
+    def test_stale_totals(self):
+        assert_equal([], UserOrder.stale_totals())
+        UserOrder.objects.filter(id=self.user_order.id).update(total_incl_gst=0)
+        assert_equal([self.user_order.id], UserOrder.stale_totals())
+        UserOrder.update_totals(UserOrder.objects.all())
+        assert_equal([], UserOrder.stale_totals())
+
+    def test_update_totals_in_batches(self):
+        other = UserOrder.objects.create(user=User.objects.create_user("g"))
+        create_order_item(other, self.supplier, unit_cost=2, quantity=2)
+        UserOrder.objects.update(subtotal_excl_gst=0, total_incl_gst=0)
+        with mock.patch.object(UserOrder, '_UPDATE_BATCH_SIZE', 1):
+            totals = UserOrder.update_totals(UserOrder.objects.all())
+        assert_equal({self.user_order.id: (22, add_gst(22)), other.id: (4, add_gst(4))}, totals)
+        assert_equal([], UserOrder.stale_totals())
+
+    def test_stale_instance_save_keeps_totals(self):
+        stale = UserOrder.objects.get(id=self.user_order.id)
+        self.item1.delete()
+        stale.status = UserOrder.STATUS_PAID
+        stale.save()
+        assert_equal((7, add_gst(7)), self.stored(UserOrder, self.user_order))
+
 
 def test_Surcharge():
     assert_equal(0.0, Surcharge.get_surcharge_percentage())
@@ -167,3 +320,129 @@ def test_Surcharge():
     assert_equal(2.35, Surcharge.get_surcharge_percentage())
     assert_equal(1.0235, Surcharge.get_factor())
     assert_equal(23.50, Surcharge.get_order_surcharge())
+
+
+class TestSurchargeCache(TestCase):
+    def setUp(self):
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache', LOCATION='orders-tests')
+        cache.clear()
+        self.cache_patch = mock.patch('main.cache.cache', cache)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+
+    def test_no_queries_once_cached(self):
+        Surcharge.objects.get_or_create(id=1)
+        Surcharge.get_factor()
+        with self.assertNumQueries(0):
+            Surcharge.get_factor()
+            Surcharge.get_order_surcharge()
+
+    def test_invalidated_on_save(self):
+        surcharge, _ = Surcharge.objects.get_or_create(id=1)
+        assert_equal(1.0, Surcharge.get_factor())
+        surcharge.surcharge_percentage = 10
+        surcharge.order_surcharge = 5
+        surcharge.save()
+        assert_equal(1.1, Surcharge.get_factor())
+        assert_equal(5.0, Surcharge.get_order_surcharge())
+
+    def test_invalidated_by_other_process(self):
+        Surcharge.objects.get_or_create(id=1)
+        Surcharge.get_factor()
+        Surcharge.objects.filter(id=1).update(surcharge_percentage=10)
+        VersionStamp("orders.surcharge").bump()
+        assert_equal(1.1, Surcharge.get_factor())
+
+
+class TestOutgoingEmail(TestCase):
+    def queue(self, key="order-confirmation-1"):
+        return OutgoingEmail.queue(key, "Order confirmation", "Thanks", ["brewer@example.com"])
+
+    def test_queue_same_key_once(self):
+        self.queue()
+        self.queue()
+        assert_equal(OutgoingEmail.objects.count(), 1)
+
+    def test_send_queued_email(self):
+        self.queue("a")
+        self.queue("b")
+        call_command('send_queued_email', stdout=StringIO())
+        assert_equal(sorted(m.subject for m in mail.outbox), ["Order confirmation"] * 2)
+        assert_equal(OutgoingEmail.objects.filter(status=OutgoingEmail.STATUS_SENT).count(), 2)
+        call_command('send_queued_email', stdout=StringIO())
+        assert_equal(len(mail.outbox), 2)
+
+    def test_send_failure_retried_then_given_up(self):
+        self.queue()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=IOError("down")):
+            for _ in range(2):
+                call_command('send_queued_email', max_attempts=2, stdout=StringIO(), stderr=StringIO())
+        email = OutgoingEmail.objects.get()
+        assert_equal((email.status, email.attempts, email.last_error), (OutgoingEmail.STATUS_FAILED, 2, "down"))
+
+    def test_marked_sent_as_each_is_sent(self):
+        self.queue("a")
+        self.queue("b")
+        send = mock.Mock(side_effect=[1, KeyboardInterrupt()])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', send):
+            self.assertRaises(KeyboardInterrupt, call_command, 'send_queued_email', stdout=StringIO())
+        assert_equal(
+            [("a", OutgoingEmail.STATUS_SENT), ("b", OutgoingEmail.STATUS_SENDING)],
+            list(OutgoingEmail.objects.order_by('key').values_list('key', 'status')))
+
+    def test_claimed_messages_skipped(self):
+        self.queue()
+        OutgoingEmail.objects.update(status=OutgoingEmail.STATUS_SENDING, claimed=timezone.now())
+        call_command('send_queued_email', stdout=StringIO())
+        assert_equal(0, len(mail.outbox))
+
+    def test_stale_claims_requeued(self):
+        self.queue()
+        OutgoingEmail.objects.update(
+            status=OutgoingEmail.STATUS_SENDING,
+            claimed=timezone.now() - timedelta(hours=1),
+            attempts=1)
+        call_command('send_queued_email', stdout=StringIO())
+        assert_equal(1, len(mail.outbox))
+        email = OutgoingEmail.objects.get()
+        assert_equal((OutgoingEmail.STATUS_SENT, 2), (email.status, email.attempts))
+
+
+class TestSupplierOrderAssignment(TestCase):
+    def setUp(self):
+        self.supplier = Supplier.objects.create(name="Gladfields")
+        self.munich = Grain.objects.create(name="Munich", unit_cost=36, unit_size="sack", supplier=self.supplier)
+        self.user_order = UserOrder.objects.create(user=User.objects.create(username="bob"))
+        self.item = OrderItem.objects.create(ingredient=self.munich, quantity=2, user_order=self.user_order)
+
+    def supplier_order(self, item):
+        return OrderItem.objects.get(id=item.id).supplier_order
+
+    def test_paid_moves_items_into_pending_order(self):
+        assert_equal(None, self.supplier_order(self.item))
+        self.user_order.status = UserOrder.STATUS_PAID
+        self.user_order.save()
+        supplier_order = self.supplier_order(self.item)
+        assert_equal((self.supplier, SupplierOrder.STATUS_PENDING), (supplier_order.supplier, supplier_order.status))
+        assert_equal(72, supplier_order.total)
+
+    def test_unpaid_moves_items_out_of_pending_order(self):
+        self.user_order.status = UserOrder.STATUS_PAID
+        self.user_order.save()
+        self.user_order.status = UserOrder.STATUS_UNPAID
+        self.user_order.save()
+        assert_equal(None, self.supplier_order(self.item))
+
+    def test_item_added_to_paid_order(self):
+        self.user_order.status = UserOrder.STATUS_PAID
+        self.user_order.save()
+        item = OrderItem.objects.create(ingredient=self.munich, quantity=1, user_order=self.user_order)
+        assert_equal(self.supplier_order(self.item), self.supplier_order(item))
+        assert_equal(108, SupplierOrder.objects.get().total)
+
+    def test_reconcile_supplier_orders(self):
+        UserOrder.objects.filter(id=self.user_order.id).update(status=UserOrder.STATUS_PAID)
+        call_command('reconcile_supplier_orders', stdout=StringIO())
+        assert_equal(SupplierOrder.objects.get(), self.supplier_order(self.item))
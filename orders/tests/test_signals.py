@@ -8,20 +8,11 @@ from paypal.standard.ipn.models import PayPalIPN
 from paypal.standard.ipn.signals import payment_was_successful
 
 from orders.signals import order_paid
-from orders.models import UserOrder, OrderItem, Ingredient
+from orders.models import UserOrder, OrderItem, Ingredient, OutgoingEmail, Supplier
 
 
 class TestPaymentWasSuccessful(TestCase):
 
-    @classmethod
-    def setUpClass(cls):
-        cls.email_patch = mock.patch('django.core.mail.send_mail')
-        cls.send_mail = cls.email_patch.start()
-
-    @classmethod
-    def tearDownClass(cls):
-        cls.email_patch.stop()
-
     def setUp(self):
         self.user = get_user_model().objects.create(username="test", password="test")
         self.user_order = UserOrder.objects.create(
@@ -34,7 +25,6 @@ class TestPaymentWasSuccessful(TestCase):
         self.email_message = FlatBlock.objects.create(
             slug='orders.email.confirmation',
             content="Order %(order_number)s, total: $%(total)s").content
-        self.__class__.send_mail.reset_mock()
 
     def test_handler_flags_user_order_as_paid(self):
         ipn = PayPalIPN()
@@ -42,7 +32,7 @@ class TestPaymentWasSuccessful(TestCase):
         payment_was_successful.send(sender=ipn)
         self.assert_order_paid()
 
-    def test_handler_sends_email(self):
+    def test_handler_queues_email(self):
         ipn = PayPalIPN()
         ipn.invoice = str(self.user_order.id)
         payment_was_successful.send(sender=ipn)
@@ -50,15 +40,37 @@ class TestPaymentWasSuccessful(TestCase):
             order_number=self.user_order.id,
             total=UserOrder.objects.get(id=self.user_order.id).total,
         )
-        self.__class__.send_mail.assert_called_once_with(
-            'Your UCBC Order #%d' % self.user_order.id,
-            message,
-            settings.ORDER_FROM_EMAIL,
-            [self.user.email, settings.ORDER_FROM_EMAIL],
-            fail_silently=True,
-            auth_user=settings.ORDER_EMAIL_HOST_USER,
-            auth_password=settings.ORDER_EMAIL_HOST_PASSWORD,
-        )
+        email = OutgoingEmail.objects.get()
+        assert_equal(email.subject, 'Your UCBC Order #%d' % self.user_order.id)
+        assert_equal(email.body, message)
+        assert_equal(email.from_email, settings.ORDER_FROM_EMAIL)
+        assert_equal(email.recipients, "%s,%s" % (self.user.email, settings.ORDER_FROM_EMAIL))
+        assert_equal(email.account, OutgoingEmail.ACCOUNT_ORDERS)
+
+    def test_handler_moves_items_into_supplier_order(self):
+        supplier = Supplier.objects.create(name="Gladfields")
+        Ingredient.objects.filter(name="Munich").update(supplier=supplier)
+        ipn = PayPalIPN()
+        ipn.invoice = str(self.user_order.id)
+        payment_was_successful.send(sender=ipn)
+        assert_equal(supplier, self.user_order.order_items.get().supplier_order.supplier)
+
+    def test_repeated_ipn_queues_one_email(self):
+        ipn = PayPalIPN()
+        ipn.invoice = str(self.user_order.id)
+        payment_was_successful.send(sender=ipn)
+        payment_was_successful.send(sender=ipn)
+        assert_equal(OutgoingEmail.objects.count(), 1)
+
+    @mock.patch("logging.getLogger")
+    def test_paid_without_confirmation_email(self, getLogger):
+        log = getLogger()
+        FlatBlock.objects.filter(slug='orders.email.confirmation').update(content="Paid in full, 100%!")
+        modified = self.user_order.modified
+        self.test_handler_flags_user_order_as_paid()
+        assert_equal(0, OutgoingEmail.objects.count())
+        log.exception.assert_called_once_with("Couldn't queue the confirmation email for order #%d" % self.user_order.id)
+        self.assertGreater(UserOrder.objects.get(id=self.user_order.id).modified, modified)
 
     @mock.patch("logging.getLogger")
     def test_order_already_paid(self, getLogger):
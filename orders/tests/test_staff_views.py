@@ -0,0 +1,126 @@
+import csv
+from http.client import FOUND, NOT_FOUND, OK
+from io import BytesIO, StringIO
+import mimetypes
+import zipfile
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django_nose.tools import assert_ok, assert_code
+from nose.tools import assert_equal, assert_in
+from orders.models import Grain, Hop, OrderItem, Supplier, SupplierOrder, UserOrder
+
+
+class _StaffViewTest(TestCase):
+    def setUp(self):
+        User.objects.create_user('temporary', 'temporary@gmail.com', 'temporary')
+        self.gladfields = Supplier.objects.create(name="Gladfields")
+        self.nzhops = Supplier.objects.create(name="NZ Hops")
+        self.munich = Grain.objects.create(name="Munich", unit_cost=12.5, unit_size="sack", supplier=self.gladfields)
+        self.sauvin = Hop.objects.create(name="Nelson Sauvin", unit_cost=4, unit_size="100g", supplier=self.nzhops)
+
+    def login(self):
+        self.assertTrue(self.client.login(username='temporary', password='temporary'))
+
+
+class TestSupplierOrderSummaryCSV(_StaffViewTest):
+    def setUp(self):
+        super(TestSupplierOrderSummaryCSV, self).setUp()
+        for username, munich, sauvin in (("c", 5, 3), ("d", 7, 2)):
+            order = UserOrder.objects.create(user=User.objects.create_user(username))
+            OrderItem.objects.create(ingredient=self.munich, quantity=munich, user_order=order)
+            OrderItem.objects.create(ingredient=self.sauvin, quantity=sauvin, user_order=order)
+
+    def test(self):
+        self.login()
+        order = SupplierOrder.objects.create(
+            supplier=self.gladfields,
+            status=SupplierOrder.STATUS_ORDERED)
+        OrderItem.objects.filter(supplier_order=None, ingredient__supplier=self.gladfields).update(supplier_order=order)
+        response = self.client.get(reverse('supplier_order_summary_csv', args=(order.id,)))
+        assert_ok(response)
+        self.assertEqual(mimetypes.types_map['.csv'], response['Content-Type'])
+        self.assertEqual('attachment; filename="Gladfields_order.csv"', response['Content-Disposition'])
+        reader = csv.reader(StringIO(b"".join(response.streaming_content).decode(encoding='UTF-8')))
+        assert_equal([["Name", "Unit Size", "Quantity"], ["Munich", "sack", "12"]], list(reader))
+
+    def test_pending_orders_zip(self):
+        self.login()
+        for supplier in (self.gladfields, self.nzhops):
+            order = SupplierOrder.objects.create(supplier=supplier)
+            OrderItem.objects.filter(supplier_order=None, ingredient__supplier=supplier).update(supplier_order=order)
+        SupplierOrder.objects.filter(supplier=self.nzhops).update(status=SupplierOrder.STATUS_ORDERED)
+        gladfields = SupplierOrder.objects.get(supplier=self.gladfields)
+        another = SupplierOrder.objects.create(supplier=self.gladfields)
+        response = self.client.get(reverse('pending_supplier_orders_zip'))
+        assert_ok(response)
+        self.assertEqual(mimetypes.types_map['.zip'], response['Content-Type'])
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        names = ["Gladfields_order_%d.csv" % gladfields.id, "Gladfields_order_%d.csv" % another.id]
+        assert_equal(names, sorted(archive.namelist()))
+        reader = csv.reader(StringIO(archive.read(names[0]).decode(encoding='UTF-8')))
+        self.assertIn(["Munich", "sack", "12"], reader)
+
+    def test_login_required(self):
+        order = SupplierOrder.objects.create(
+            supplier=self.gladfields,
+            status=SupplierOrder.STATUS_ORDERED)
+        for url in (reverse('supplier_order_summary_csv', args=(order.id,)), reverse('pending_supplier_orders_zip')):
+            response = self.client.get(url)
+            assert_code(response, FOUND)
+            self.assertIn('login', response['Location'])
+
+
+class TestImportIngredientsFromCSV(_StaffViewTest):
+    def setUp(self):
+        super(TestImportIngredientsFromCSV, self).setUp()
+        User.objects.filter(username='temporary').update(is_staff=True)
+
+    def post(self, model_name, rows, **data):
+        content = "name,unit_cost,unit_size,supplier_name\n" + "".join(",".join(row) + "\n" for row in rows)
+        data['file'] = SimpleUploadedFile("prices.csv", content.encode('utf-8'), content_type="text/csv")
+        return self.client.post(reverse('import_ingredients', args=(model_name,)), data)
+
+    def names(self, model):
+        return list(model.objects.order_by('name').values_list('name', flat=True))
+
+    def test_grains_created(self):
+        self.login()
+        response = self.post('Grain', [("Test Grain", "12", "sack", "Gladfields"), ("Test 2", "23", "Kg", "Gladfields")])
+        assert_code(response, FOUND)
+        assert_equal(["Munich", "Test 2", "Test Grain"], self.names(Grain))
+        assert_equal(("sack", self.gladfields), (Grain.objects.get(name="Test Grain").unit_size,
+                                                 Grain.objects.get(name="Test Grain").supplier))
+
+    def test_hops_created(self):
+        self.login()
+        assert_code(self.post('Hop', [("Saaz", "12", "100g", "NZ Hops")]), FOUND)
+        assert_equal(["Nelson Sauvin", "Saaz"], self.names(Hop))
+
+    def test_bad_rows_skipped(self):
+        self.login()
+        response = self.post('Grain', [("Test Grain", "13", "Kg", "bad supplier"),
+                                       ("Test 2", "13", "bad unit size", "Gladfields")])
+        assert_code(response, FOUND)
+        assert_equal(["Munich"], self.names(Grain))
+
+    def test_dry_run(self):
+        self.login()
+        response = self.post('Grain', [("Wheat", "2.5", "Kg", "Gladfields")], dry_run="1", remove_missing="on")
+        assert_code(response, OK)
+        assert_equal((["Wheat"], ["Munich"]), (response.context['preview'].created, response.context['preview'].removed))
+        assert_in("Preview, nothing has been saved yet", response.content.decode('utf-8'))
+        assert_equal(["Munich"], self.names(Grain))
+
+    def test_only_grains_and_hops(self):
+        self.login()
+        assert_code(self.client.get(reverse('import_ingredients', args=('Supplier',))), NOT_FOUND)
+
+    def test_staff_only(self):
+        self.assertTemplateUsed(self.client.get(reverse('import_ingredients', args=('Hop',))), 'admin/login.html')
+        User.objects.create_user('member', 'member@gmail.com', 'member')
+        self.assertTrue(self.client.login(username='member', password='member'))
+        response = self.post('Grain', [("Wheat", "2.5", "Kg", "Gladfields")], remove_missing="on")
+        self.assertTemplateUsed(response, 'admin/login.html')
+        assert_equal(["Munich"], self.names(Grain))
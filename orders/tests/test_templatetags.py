@@ -1,5 +1,7 @@
+import locale
+from nose.plugins.skip import SkipTest
 from nose.tools import assert_equal
-from orders.templatetags.currency import currency, add_gst
+from orders.templatetags.currency import currency, add_gst, CurrencyFormat
 
 
 def test_currency():
@@ -9,6 +11,34 @@ def test_currency():
     assert_equal("$0.00", currency(""))
     assert_equal("$0.00", currency(None))
     assert_equal("$0.00", currency(0))
+    assert_equal("$1,234,567.89", currency(1234567.891))
+    assert_equal("-$1,234.50", currency(-1234.5))
+    assert_equal("1,234.50", currency(1234.5, symbol=False))
+    assert_equal("", currency("abc"))
+    assert_equal("", currency(3, "xx_XX"))
+
+
+def test_currency_matches_locale():
+    saved = locale.setlocale(locale.LC_ALL)
+    try:
+        locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+    except locale.Error:
+        raise SkipTest("en_US.UTF-8 locale isn't installed")
+    try:
+        for value in (0, 3, -5, 22.5, 999.995, -0.001, 1234567.891, 10 ** 9):
+            assert_equal(locale.currency(value, True, True), currency(value))
+    finally:
+        locale.setlocale(locale.LC_ALL, saved)
+
+
+def test_currency_format_placement():
+    conv = {
+        'currency_symbol': 'EUR', 'frac_digits': 2, 'mon_decimal_point': ',', 'mon_grouping': [3, 3, 0],
+        'mon_thousands_sep': '.', 'n_cs_precedes': 0, 'n_sep_by_space': 1, 'n_sign_posn': 0,
+        'negative_sign': '-', 'p_cs_precedes': 0, 'p_sep_by_space': 1, 'p_sign_posn': 1, 'positive_sign': '',
+    }
+    assert_equal("1.234,50 EUR", CurrencyFormat(conv).format(1234.5))
+    assert_equal("(1.234,50 EUR)", CurrencyFormat(conv).format(-1234.5))
 
 
 def test_add_gst():
@@ -1,7 +1,7 @@
 from django.test import TestCase
 from nose.tools import assert_equal, raises
 from orders.models import Hop, Ingredient, Supplier, Grain, Surcharge
-from orders.utils import get_ingredient, order_total_incl_gst, add_gst
+from orders.utils import CartLine, get_ingredient, get_ingredients, order_total_incl_gst, add_gst
 
 
 class TestGetIngredient(TestCase):
@@ -22,6 +22,18 @@ class TestGetIngredient(TestCase):
         get_ingredient("wheat")
 
 
+class TestGetIngredients(TestCase):
+    def test_single_query(self):
+        hop = Hop.objects.create(name="saaz", unit_cost=12.3, unit_size="100g")
+        grain = Grain.objects.create(name="munich", unit_cost=12.3, unit_size="sack")
+        with self.assertNumQueries(1):
+            ingredients = get_ingredients(["saaz", "munich", "wheat"])
+        assert_equal({"saaz": hop, "munich": grain}, ingredients)
+        assert_equal(Hop, type(ingredients["saaz"]))
+        assert_equal(Grain, type(ingredients["munich"]))
+        assert_equal("munich", ingredients["munich"].name)
+
+
 def test_order_total():
     nzhops = Supplier.objects.create(name="NZ Hops")
     cryer = Supplier.objects.create(name="Cryer")
@@ -34,3 +46,15 @@ def test_order_total():
     expected_total = add_gst(expected_total)
     expected_total += 12.70
     assert_equal(round(expected_total, 3), round(total, 3))
+
+
+class TestCartLine(TestCase):
+    def test_line(self):
+        grain = Grain.objects.create(name="munich", unit_cost=12.5, unit_size="sack")
+        line = CartLine(None, grain, 2)
+        assert_equal(25.0, line.total)
+        assert_equal("2 sacks", line.quantity_display)
+
+    def test_unknown_unit_size(self):
+        line = CartLine(None, Grain(name="munich", unit_cost=12.5, unit_size="bag"), 2)
+        assert_equal(2, line.quantity_display)
@@ -1,10 +1,6 @@
 from collections import OrderedDict
-import csv
-from http.client import CREATED, OK, BAD_REQUEST, FORBIDDEN, FOUND, NOT_FOUND
-import mimetypes
-from io import StringIO
-import os
-import tempfile
+from http.client import CREATED, OK, BAD_REQUEST, FORBIDDEN, NOT_FOUND
+import smtplib
 from allauth.account.models import EmailAddress
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
@@ -13,13 +9,13 @@ from django.test import TestCase
 from django_nose.tools import assert_ok, assert_code
 from django_webtest import WebTest
 import mock
-from nose.tools import raises
+from nose.tools import assert_equal, raises
 from webtest import AppError
 
-from orders.models import Grain, Supplier, Hop, UserOrder, OrdersEnabled, SupplierOrder, OrderItem, Ingredient
+from orders.models import Grain, Supplier, Hop, UserOrder, OrdersEnabled, OutgoingEmail
 from orders import utils
 
-ORDER_GRAINS_URL = reverse('order_grain')
+ORDER_GRAINS_URL = reverse('order_gladfield')
 ORDER_HOPS_URL = reverse('order_hops')
 CHECKOUT_URL = reverse('checkout')
 
@@ -33,12 +29,12 @@ class _CommonMixin(object):
         self.munich = Grain.objects.create(
             name="Munich",
             unit_cost=12.5,
-            unit_size=Grain.UNIT_SIZE_SACK,
+            unit_size="sack",
             supplier=self.gladfields)
         self.sauvin = Hop.objects.create(
             name="Nelson Sauvin",
             unit_cost=4,
-            unit_size=Hop.UNIT_SIZE_100G,
+            unit_size="100g",
             supplier=self.nzhops)
         self.orders_enabled, success = OrdersEnabled.objects.get_or_create(id=1)
         self.orders_enabled.enabled = True
@@ -188,161 +184,54 @@ class TestCartDeleteItem(_WebTest):
 
 
 class TestCheckout(_WebTest):
-    @mock.patch('django.core.mail.send_mail')
-    def test_email_sent(self, send_mail):
+    def review_order(self):
         self._login()
-        # Add some hops to cart:
-        response = self.app.get(ORDER_HOPS_URL)
-        add_grain_to_order_form = response.forms.get(0)
-        add_grain_to_order_form['ingredients-0-quantity'] = 5
-        response = add_grain_to_order_form.submit()
-        self.assertRedirects(response, ORDER_HOPS_URL)
-        response = response.follow()
-
-        cart_form = response.forms.get(1)
-        self.assertEqual(str(self.sauvin.id), cart_form.get('cart-0-ingredient').value)
-        self.assertEqual('5', cart_form.get('cart-0-quantity').value)
-
-        response = cart_form.submit()
-        cart_form = response.forms.get(0)
-        cart_form.submit()
-        order_number = UserOrder.objects.count()
-
-        self.assertGreater(UserOrder.objects.get(id=order_number).total, 0)
+        for url, quantity in ((ORDER_HOPS_URL, 5), (ORDER_GRAINS_URL, 2)):
+            form = self.app.get(url).forms.get(0)
+            form['ingredients-0-quantity'] = quantity
+            form.submit()
+        return self.app.get(reverse('review_order'))
+
+    def test_order_saved(self):
+        review = self.review_order()
+        with mock.patch('orders.models.OrderItem.save') as save:
+            response = review.forms.get(0).submit()
+        assert_equal(0, save.call_count)
+        order = UserOrder.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('payment', args=(order.id,)))
+        assert_equal(
+            [("Munich", 2, 12.5), ("Nelson Sauvin", 5, 4)],
+            [(i.ingredient.name, i.quantity, i.unit_cost) for i in order.order_items.order_by('ingredient__name')])
+        self.assertGreater(order.total, 0)
+        assert_equal([], UserOrder.stale_totals())
+        self.assertNotIn('cart', self.app.session)
+
+    def test_invalid_cart_not_saved(self):
+        review = self.review_order()
+        self.sauvin.delete()
+        response = review.forms.get(0).submit(expect_errors=True)
+        assert_code(response, BAD_REQUEST)
+        assert_equal(0, UserOrder.objects.count())
 
 
-class TestSupplierOrderSummaryCSV(TestCase, _CommonMixin):
-    def setUp(self):
-        super(TestSupplierOrderSummaryCSV, self).setUp()
-        _CommonMixin.setUp(self)
-        self.client = Client()
-        self.order = UserOrder.objects.create(user=User.objects.create_user("c"))
-        OrderItem.objects.create(
-            ingredient=self.munich,
-            quantity=5,
-            user_order=self.order,
-        )
-        OrderItem.objects.create(
-            ingredient=self.sauvin,
-            quantity=3,
-            user_order=self.order,
-        )
-        self.order2 = UserOrder.objects.create(user=User.objects.create_user("d"))
-        OrderItem.objects.create(
-            ingredient=self.munich,
-            quantity=7,
-            user_order=self.order2,
-        )
-        OrderItem.objects.create(
-            ingredient=self.sauvin,
-            quantity=2,
-            user_order=self.order2,
-        )
-
-    def test(self):
-        self.assertTrue(self.client.login(username='temporary', password='temporary'))
-        order = SupplierOrder.objects.create(
-            supplier=self.gladfields,
-            status=SupplierOrder.STATUS_ORDERED)
-        OrderItem.objects.filter(supplier_order=None, ingredient__supplier=self.gladfields).update(supplier_order=order)
-        response = self.client.get(reverse('supplier_order_summary_csv', args=(order.id,)))
-        assert_ok(response)
-        self.assertEqual(mimetypes.types_map['.csv'], response['Content-Type'])
-        self.assertEqual('attachment; filename="Gladfields_order.csv"', response['Content-Disposition'])
-        response_body = response.content.decode(encoding='UTF-8')
-        f = StringIO(response_body)
-        reader = csv.reader(f)
-        self.assertIn(["Name", "Unit Size", "Quantity"], reader)
-        self.assertIn(["Munich", "sack", "12"], reader)
-
-    def test_login_required(self):
-        order = SupplierOrder.objects.create(
-            supplier=self.gladfields,
-            status=SupplierOrder.STATUS_ORDERED)
-        response = self.client.get(reverse('supplier_order_summary_csv', args=(order.id,)))
-        assert_code(response, FOUND)
-        self.assertIn('login', response['Location'])
-
-
-class TestImportIngredientsFromCSV(_WebTest, _CommonMixin):
+class TestPayment(TestCase, _CommonMixin):
     def setUp(self):
-        # super(TestSupplierOrderSummaryCSV, self).setUp()
         _CommonMixin.setUp(self)
-        # self.client = Client()
-
-    def create_csv(self, tempdir, *rows):
-        filename = os.path.join(tempdir, "temp.csv")
-        with open(filename, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['name', 'unit_cost', 'unit_size', 'supplier_name', 'type'])
-            writer.writerows(rows)
-        return filename
-
-    def submit_file_form(self, filename, response):
-        form = response.form
-        form['file'] = StringIO(filename)
-        return form.submit()
-
-    def _assert_ingredient(self, model, name, cost, size, supplier_name):
-        new_ingredient = model.objects.get(name=name)
-        self.assertEqual(new_ingredient.unit_cost, cost)
-        self.assertEqual(new_ingredient.unit_size, size)
-        self.assertEqual(new_ingredient.supplier, Supplier.objects.get(name=supplier_name))
-
-    def assert_grain(self, name, cost, size, supplier_name):
-        return self._assert_ingredient(Grain, name, cost, size, supplier_name)
-
-    def assert_hop(self, name, cost, size, supplier_name):
-        return self._assert_ingredient(Hop, name, cost, size, supplier_name)
-
-    def assert_no_ingredient(self, name):
-        self.assertRaises(Ingredient.DoesNotExist, Ingredient.objects.get, name=name)
+        self.order = UserOrder.objects.create(user=self.user)
+        self.url = reverse('payment', args=(self.order.id,))
 
-    def test_grains_created(self):
-        self._login()
-        for name, cost, size, supplier_name in (('Test Grain', '12', 'sack', 'Gladfields'),
-                                                ('Test 2', '23', 'Kg', 'Gladfields')):
-            response = self.app.get(reverse('import_ingredients', args=('Grain',)))
-            with tempfile.TemporaryDirectory() as tempdir:
-                filename = self.create_csv(tempdir, [name, cost, size, supplier_name])
-                response = self.submit_file_form(filename, response)
-                assert_code(response, FOUND)
-                self.assertIn(reverse('import_ingredients', args=('Grain',)), response['Location'])
-            self.assert_grain(name, float(cost), size, supplier_name)
-
-
-    def test_hops_created(self):
-        self._login()
-        for name, cost, size, supplier_name in (('Saaz', '12', '100g', 'NZ Hops'),
-                                                ('Test Hop', '23', 'Kg', 'NZ Hops')):
-            response = self.app.get(reverse('import_ingredients', args=('Hop',)))
-            with tempfile.TemporaryDirectory() as tempdir:
-                filename = self.create_csv(tempdir, [name, cost, size, supplier_name])
-                response = self.submit_file_form(filename, response)
-                assert_code(response, FOUND)
-                self.assertIn(reverse('import_ingredients', args=('Hop',)), response['Location'])
-            self.assert_hop(name, float(cost), size, supplier_name)
-
-    @raises(AppError)
-    def test_supplier_doesnt_exist_404(self):
-        self._login()
-        response = self.app.get(reverse('import_ingredients', args=('Grain',)))
-        with tempfile.TemporaryDirectory() as tempdir:
-            filename = self.create_csv(tempdir, ["Test Grain", 13, "Kg", "bad supplier"])
-            self.submit_file_form(filename, response)
-
-    def test_bad_unit_size(self):
-        self._login()
-        response = self.app.get(reverse('import_ingredients', args=('Grain',)))
-        with tempfile.TemporaryDirectory() as tempdir:
-            filename = self.create_csv(tempdir, ["Test Grain", 13, "bad unit size", "Gladfields"])
-            response = self.submit_file_form(filename, response)
-            assert_code(response, FOUND)
-            self.assertIn(reverse('import_ingredients', args=('Grain',)), response['Location'])
-        self.assert_no_ingredient("Test Grain")
-
-
-    def test_login_required(self):
-        response = self.app.get(reverse('import_ingredients', args=('Hop',)))
-        assert_code(response, FOUND)
-        self.assertIn(reverse('account_login'), response['Location'])
+    def test_confirmation_queued_once(self):
+        self.client.login(username='temporary', password='temporary')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                        side_effect=smtplib.SMTPException) as send_messages:
+            assert_ok(self.client.get(self.url))
+            assert_ok(self.client.get(self.url))
+        assert_equal(0, send_messages.call_count)
+        assert_equal(["order-confirmation-%d" % self.order.id], list(OutgoingEmail.objects.values_list('key', flat=True)))
+        assert_equal("temporary@gmail.com", OutgoingEmail.objects.get().recipients)
+
+    def test_other_users_order_not_found(self):
+        User.objects.create_user('other', 'other@gmail.com', 'other')
+        self.client.login(username='other', password='other')
+        assert_code(self.client.get(self.url), NOT_FOUND)
+        assert_equal(0, OutgoingEmail.objects.count())
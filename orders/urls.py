@@ -19,6 +19,7 @@ urlpatterns = patterns('',
     url(r'^history/$', views.UserOrderListView.as_view(), name='order_history'),
     url(r'^order/(?P<order_id>\d+)/$', views.UserOrderItemListView.as_view(), name='order'),
     url(r'^supplier/csv/(?P<order_id>\d+)/$', 'orders.views.supplier_order_summary_csv', name='supplier_order_summary_csv'),
+    url(r'^supplier/csv/pending\.zip$', 'orders.views.pending_supplier_orders_zip', name='pending_supplier_orders_zip'),
     url(r'^import/(?P<model_name>\w+)/$', 'orders.views.import_ingredients_from_csv', name='import_ingredients'),
     url(r'^payment/(?P<order_id>\d+)/$', 'orders.views.payment', name='payment'),
     url(r'^payment/ASD45623SDF7878aetrty/', include('paypal.standard.ipn.urls')),
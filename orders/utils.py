@@ -1,4 +1,4 @@
-from orders import models
+from orders import catalog, models
 from orders.models import Surcharge
 
 NZ_GST = 1.15
@@ -9,15 +9,45 @@ def add_gst(amount):
 
 
 def order_total_incl_gst(ingredients, quantities):
-    item_total = lambda i, q: float(i.unit_cost_excl_gst_incl_surcharge) * q
+    surcharge = Surcharge.current()
+    factor = models.surcharge_factor(surcharge.surcharge_percentage)
+    item_total = lambda i, q: float(i.unit_cost) * factor * q
     total = sum(map(item_total, ingredients, quantities))
     total = add_gst(total)
-    total += Surcharge.get_order_surcharge()
+    total += float(surcharge.order_surcharge)
     return total
 
 
+class CartLine(object):
+    """
+    A row of the cart, with everything the cart template shows worked out up front.
+    Pass the surcharge ``factor`` when making the lines of a cart, so it's read once.
+    """
+    def __init__(self, form, ingredient, quantity, factor=None):
+        self.form = form
+        self.ingredient = ingredient
+        self.quantity = quantity
+        if factor is None:
+            factor = Surcharge.get_factor()
+        self.total = float(ingredient.unit_cost) * factor * quantity
+        try:
+            self.quantity_display = models.Ingredient.unit_size_plural(ingredient.unit_size, quantity)
+        except Exception:
+            self.quantity_display = quantity
+
+
+def get_ingredients(names):
+    """
+    Resolve ingredient names to their Hop/Grain rows, returns {name: ingredient}.
+    Names that aren't in the catalog are left out.
+    """
+    index = catalog.ingredient_index()
+    return dict((name, index[name]) for name in names if name in index)
+
+
 def get_ingredient(name):
     try:
-        return models.Hop.objects.get(name=name)
-    except models.Hop.DoesNotExist:
-        return models.Grain.objects.get(name=name)
+        return get_ingredients([name])[name]
+    except KeyError:
+        # Grain.DoesNotExist as this used to look for a Hop, then a Grain
+        raise models.Grain.DoesNotExist("No hop or grain called %s" % name)
@@ -1,33 +1,38 @@
 import csv
 from functools import wraps
 from http.client import OK, CREATED, BAD_REQUEST
-from io import StringIO
 import logging
 import mimetypes
+import tempfile
 from urllib.parse import urljoin
+from wsgiref.util import FileWrapper
+import zipfile
 
 from django import forms
 from django.conf import settings
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
-from django.forms.models import inlineformset_factory
-from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, Http404
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, Http404, \
+    StreamingHttpResponse
 from django.shortcuts import render_to_response, render, get_object_or_404
-from django.forms.formsets import formset_factory
 from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
 from django.views.generic import TemplateView, ListView
 from django.template import RequestContext
 from django.template.loader import render_to_string
-from django.core import mail
 from django.views.decorators.http import require_POST, require_GET
 from paypal.standard.forms import PayPalPaymentsForm
 
-from orders import models
-from orders.forms import CartItemForm, OrderItemFormset
+from orders import catalog, models
+from orders.forms import CartFormset
+from orders.importers import IngredientImporter
 from orders.models import OrdersEnabled
-from orders.utils import get_ingredient
+from orders.utils import CartLine, get_ingredients, order_total_incl_gst
 
 log = logging.getLogger(__name__)
+MAX_IMPORT_ERRORS_SHOWN = 50
 
 
 def orders_enabled(view):
@@ -48,28 +53,22 @@ def main(request):
     return render_to_response('orders/main.html', context_instance=RequestContext(request))
 
 
-def create_cart_formset(request, user_order=None):
+def create_cart_formset(request):
     cart = _get_cart_from_session(request)
-    initial = [dict(ingredient=get_ingredient(name), quantity=q) for name, q in cart.items()]
-    Formset = inlineformset_factory(
-        models.UserOrder,
-        models.OrderItem,
-        formset=OrderItemFormset,
-        extra=len(initial),
-        max_num=len(initial),
-        fields=("quantity", "ingredient"),
-        widgets={
-            "ingredient": forms.HiddenInput(),
-            "quantity": forms.HiddenInput(),
-        })
+    ingredients = get_ingredients(cart.keys())
+    for name in set(cart) - set(ingredients):
+        log.warning("create_cart_formset: %s is no longer in the catalog" % name)
+    lines = [(ingredients[name], q) for name, q in cart.items() if name in ingredients]
     data = request.POST if request.POST else None
-    if not user_order:
-        user_order = models.UserOrder(user=request.user)
-    cart_formset = Formset(
+    cart_formset = CartFormset(
         data=data,
-        instance=user_order,
-        initial=initial,
+        instance=models.UserOrder(user=request.user),
+        initial=[dict(ingredient=i.pk, quantity=q) for i, q in lines],
         prefix="cart")
+    # View model for orders/cart.html, so rendering it doesn't look anything up per line
+    factor = models.Surcharge.get_factor()
+    cart_formset.lines = [CartLine(form, i, q, factor) for form, (i, q) in zip(cart_formset, lines)]
+    cart_formset.total = order_total_incl_gst([i for i, _ in lines], [q for _, q in lines])
     return cart_formset
 
 
@@ -113,16 +112,17 @@ class OrderIngredientView(TemplateView):
                 'ingredient_formset': formset},
             status=BAD_REQUEST)
 
-    @property
+    @cached_property
     def initial(self):
+        # A new view instance is created for every request, so this is per request
         return [dict(
-            ingredient_name=i.name,
-            quantity=0, unit_cost=i.unit_cost_excl_gst_incl_surcharge,
-            unit_size=i.unit_size) for i in self.queryset.all()]
+            ingredient_name=name,
+            quantity=0, unit_cost=unit_cost,
+            unit_size=unit_size) for name, unit_cost, unit_size in catalog.snapshot(self.title, self.queryset)]
 
     @property
     def formset_class(self):
-        return formset_factory(CartItemForm, max_num=len(self.initial))
+        return catalog.formset_class(len(self.initial))
 
     @property
     def title(self):
@@ -153,13 +153,11 @@ def review_order(request):
 def checkout(request):
     # ToDo: check that order has been reviewed!
     # ToDo: Email user a summary
-    user_order = models.UserOrder.objects.create(user=request.user)
-    formset = create_cart_formset(request, user_order)
+    formset = create_cart_formset(request)
     if formset.is_valid():
-        formset.save()
+        user_order = formset.save()
         del request.session['cart']
-        return HttpResponseRedirect(redirect_to=reverse('payment', args=(formset.instance.id,)))
-    user_order.delete()
+        return HttpResponseRedirect(redirect_to=reverse('payment', args=(user_order.id,)))
     # ToDo: email admin on failure
     return HttpResponseBadRequest('Could not complete your order')
 
@@ -167,17 +165,14 @@ def checkout(request):
 @require_GET
 @login_required
 def payment(request, order_id):
-    order = models.UserOrder.objects.get(id=int(order_id))
+    order = get_object_or_404(models.UserOrder, id=int(order_id), user=request.user)
 
-    message = render_to_string(
-        'orders/email/order_confirmation.txt',
-        {'order': order})
-    mail.send_mail(
+    # Sent by the send_queued_email command, once per order however often the page is loaded
+    models.OutgoingEmail.queue(
+        "order-confirmation-%d" % order.id,
         'Order confirmation for order #%d' % order.id,
-        message,
-        None,
-        [request.user.email],
-        fail_silently=False)
+        render_to_string('orders/email/order_confirmation.txt', {'order': order}),
+        [request.user.email])
 
     return render(request, 'orders/payment.html', {'order': order})
 
@@ -228,50 +223,86 @@ class UserOrderItemListView(ListView):
 
 
 
+class _Echo(object):
+    """ Pseudo-file for csv.writer that returns each row rather than storing it """
+    def write(self, value):
+        return value
+
+
+def _supplier_order_csv_lines(order):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['Name', "Unit Size", 'Quantity'])
+    for row in order.summary_rows():
+        yield writer.writerow([row.name, row.unit_size, row.quantity])
+
+
 @require_GET
 @login_required
 def supplier_order_summary_csv(request, order_id):
-    order = get_object_or_404(models.SupplierOrder, id=order_id)
-    response = HttpResponse(content_type=mimetypes.types_map['.csv'])
+    order = get_object_or_404(models.SupplierOrder.objects.select_related('supplier'), id=order_id)
+    response = StreamingHttpResponse(_supplier_order_csv_lines(order), content_type=mimetypes.types_map['.csv'])
     response['Content-Disposition'] = 'attachment; filename="%s_order.csv"' % order.supplier.name
-
-    writer = csv.writer(response)
-    writer.writerow(['Name', "Unit Size", 'Quantity'])
-    for name, (quantity, total) in order.summary.items():
-        ingredient = models.Ingredient.objects.get(name=name)
-        writer.writerow([name, ingredient.unit_size, quantity])
     return response
 
 
+@require_GET
 @login_required
+def pending_supplier_orders_zip(request):
+    """ The CSV summary of every pending supplier order, zipped up """
+    # Spooled to disk if it gets big, zipfile needs to seek so it can't stream directly
+    archive = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for order in models.SupplierOrder.pending_orders().select_related('supplier'):
+            # A supplier can have more than one pending order, so the names include the order's id
+            name = "%s_order_%d.csv" % (order.supplier.name, order.id)
+            zip_file.writestr(name, "".join(_supplier_order_csv_lines(order)))
+    size = archive.tell()
+    archive.seek(0)
+    response = StreamingHttpResponse(FileWrapper(archive), content_type=mimetypes.types_map['.zip'])
+    response['Content-Length'] = size
+    response['Content-Disposition'] = 'attachment; filename="pending_supplier_orders.zip"'
+    return response
+
+
+@staff_member_required
 def import_ingredients_from_csv(request, model_name):
-    if hasattr(models, model_name):
+    if model_name in ('Grain', 'Hop'):
         model_ = getattr(models, model_name)
     else:
         raise Http404()
 
     class UploadFileForm(forms.Form):
         file = forms.FileField(widget=forms.FileInput(attrs={"class": "form-control input-sm"}))
-
-    class IngredientUploadForm(forms.ModelForm):
-        class Meta:
-            model = model_
+        remove_missing = forms.BooleanField(
+            required=False,
+            label="Remove the suppliers' ingredients that aren't in the file")
 
     if request.method == "POST":
-        contents = "".join([c.decode(encoding='UTF-8') for c in request.FILES['file'].chunks()])
-        reader = csv.reader(StringIO(contents))
-        for row in reader:
-            if reader.line_num > 1:
-                form = IngredientUploadForm(data={
-                    'name': row[0],
-                    'unit_cost': float(row[1]),
-                    'unit_size': row[2],
-                    'supplier': get_object_or_404(models.Supplier, name=row[3]).id,
-                })
-                if form.is_valid():
-                    form.save()
-                else:
-                    log.info("Import validation errors: %s" % form.errors)
+        form = UploadFileForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return render(request, 'orders/import_ingredients.html', {'form': form})
+        # Sent by the "Preview changes" button
+        dry_run = 'dry_run' in request.POST
+        try:
+            result = IngredientImporter(
+                model_,
+                remove_missing=form.cleaned_data['remove_missing'],
+                dry_run=dry_run).run(form.cleaned_data['file'].chunks())
+        except UnicodeDecodeError:
+            messages.error(request, "Couldn't read the file, it should be a UTF-8 encoded CSV")
+            return HttpResponseRedirect('')
+        if dry_run:
+            return render(request, 'orders/import_ingredients.html', {'form': form, 'preview': result})
+        messages.success(request, "%d created, %d updated, %d unchanged, %d removed" % (
+            len(result.created), len(result.updated), result.unchanged, len(result.removed)))
+        if result.kept:
+            messages.warning(request, "Kept as they've been ordered: %s" % ", ".join(result.kept))
+        for error in result.errors[:MAX_IMPORT_ERRORS_SHOWN]:
+            messages.error(request, "Line %d: %s" % error)
+        if len(result.errors) > MAX_IMPORT_ERRORS_SHOWN:
+            messages.error(request, "... and %d more errors" % (len(result.errors) - MAX_IMPORT_ERRORS_SHOWN))
+        for error in result.errors:
+            log.info("Import validation error, line %d: %s" % error)
         return HttpResponseRedirect('')
     else:
 
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Time to render a 200 row catalog's prices with the currency filter, formatting with
+CurrencyFormat vs setting the process's locale around locale.currency() as it used to.
+
+    ./scripts/benchmark_currency.py [rows] [renders]
+"""
+import locale
+import sys
+import os
+import time
+
+sys.path.append(os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ucbc.settings.dev")
+
+from django.template import Context, Template
+from orders.templatetags import currency as currency_tags
+
+CATALOG = """{% load currency %}{% for price in prices %}
+<tr><td>{{ price|add_gst|currency }} per sack</td><td>{{ price|currency }}</td></tr>{% endfor %}"""
+
+
+def setlocale_currency(value, arg='', symbol=True):
+    """ The filter as it was, setting the locale for every value """
+    saved = '.'.join([x for x in locale.getlocale() if x]) or (None, None)
+    given = arg and ('.' in arg and str(arg) or str(arg) + '.UTF-8') or 'en_US.UTF-8'
+    try:
+        locale.setlocale(locale.LC_ALL, given)
+        return locale.currency(value or 0, symbol, True)
+    except (TypeError, locale.Error):
+        return ''
+    finally:
+        locale.setlocale(locale.LC_ALL, saved)
+
+
+def render_time(currency_filter, context, renders):
+    currency_tags.register.filters['currency'] = currency_filter
+    template = Template(CATALOG)
+    start = time.time()
+    for _ in range(renders):
+        output = template.render(context)
+    return time.time() - start, output
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    renders = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    context = Context(dict(prices=[1.5 + i * 37.25 for i in range(rows)]))
+    new, output = render_time(currency_tags.currency, context, renders)
+    try:
+        old, old_output = render_time(setlocale_currency, context, renders)
+    except locale.Error:
+        sys.exit("The en_US.UTF-8 locale needs to be installed")
+    finally:
+        currency_tags.register.filters['currency'] = currency_tags.currency
+    print("%d rows, %d renders" % (rows, renders))
+    print("%16s %14s" % ("filter", "ms per render"))
+    print("%16s %14.2f" % ("setlocale", old * 1000 / renders))
+    print("%16s %14.2f" % ("CurrencyFormat", new * 1000 / renders))
+    print("speedup %.1fx, output %s" % (old / new, "identical" if output == old_output else "DIFFERS"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Messages per second sent to a local SMTP sink (see smtp_sink.py), opening a connection
+per message as Django's SMTP backend does with send_mail(), vs the pooled backend.
+
+    ./scripts/benchmark_email.py [messages]
+"""
+import asyncore
+import sys
+import os
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ucbc.settings.dev")
+
+from django.core import mail
+from smtp_sink import SinkServer
+
+PORT = 1026
+BACKENDS = (
+    ('connection per message', 'django.core.mail.backends.smtp.EmailBackend'),
+    ('pooled', 'main.mail.PooledEmailBackend'),
+)
+
+
+def send(backend, count):
+    for i in range(count):
+        connection = mail.get_connection(
+            backend, host='127.0.0.1', port=PORT, username='', password='', use_tls=False)
+        mail.EmailMessage("Benchmark #%d" % i, "Body", "admin@ucbc.org.nz", ["member@ucbc.org.nz"],
+                          connection=connection).send()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    sink = SinkServer(PORT)
+    thread = threading.Thread(target=asyncore.loop, kwargs=dict(timeout=0.05))
+    thread.daemon = True
+    thread.start()
+    print("%d messages" % count)
+    print("%24s %10s %14s" % ("backend", "seconds", "messages/sec"))
+    for name, backend in BACKENDS:
+        start = time.time()
+        send(backend, count)
+        elapsed = time.time() - start
+        print("%24s %10.2f %14.1f" % (name, elapsed, count / elapsed))
+    print("sink received %d" % sink.received)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""
+How password hashing throughput for bulk member onboarding scales with worker processes.
+
+    ./scripts/benchmark_password_hashing.py [passwords] [max workers]
+"""
+import multiprocessing
+import sys
+import os
+import time
+
+sys.path.append(os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ucbc.settings.dev")
+
+from django.contrib.auth.hashers import get_hasher
+from main.members import hash_passwords
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    passwords = ["password%d" % i for i in range(count)]
+    hasher = get_hasher()
+    print("%d passwords, %s (%d iterations), %d CPUs" % (
+        count, hasher.algorithm, getattr(hasher, 'iterations', 0), multiprocessing.cpu_count()))
+    print("%8s %10s %12s %8s" % ("workers", "seconds", "hashes/sec", "speedup"))
+    baseline = None
+    for workers in sorted(set([2 ** i for i in range(max_workers.bit_length()) if 2 ** i <= max_workers] +
+                              [max_workers])):
+        start = time.time()
+        hash_passwords(passwords, workers)
+        elapsed = time.time() - start
+        baseline = baseline or elapsed
+        print("%8d %10.2f %12.1f %7.2fx" % (workers, elapsed, count / elapsed, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""
+A local SMTP server that accepts and discards all mail, for trying out and benchmarking
+the email backend without sending anything. Run it then point the site at it with
+EMAIL_HOST = 'localhost', EMAIL_PORT = 1025, EMAIL_USE_TLS = False.
+
+    ./scripts/smtp_sink.py [port] [-v]
+"""
+import asyncore
+import smtpd
+import sys
+
+
+class SinkServer(smtpd.SMTPServer):
+    def __init__(self, port, verbose=False):
+        smtpd.SMTPServer.__init__(self, ('127.0.0.1', port), None)
+        self.verbose = verbose
+        self.received = 0
+
+    def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+        self.received += 1
+        if self.verbose:
+            print("#%d from %s to %s, %d bytes" % (self.received, mailfrom, ", ".join(rcpttos), len(data)))
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else 1025
+    SinkServer(port, verbose="-v" in sys.argv)
+    print("Discarding mail sent to localhost:%d" % port)
+    try:
+        asyncore.loop()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ DEBUG = False
 TEMPLATE_DEBUG = True
 ALLOWED_HOSTS = ['127.0.0.1']
 APPEND_SLASH = True
+# Keeps an SMTP connection open per set of credentials, see main/mail.py
+EMAIL_BACKEND = 'main.mail.PooledEmailBackend'
 EMAIL_USE_TLS = True
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
@@ -46,6 +48,7 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'main.middleware.VersionStampMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -67,6 +70,7 @@ TEMPLATE_CONTEXT_PROCESSORS = (
     'django.core.context_processors.csrf',
     "allauth.account.context_processors.account",
     "allauth.socialaccount.context_processors.socialaccount",
+    "orders.context_processors.orders_enabled",
 )
 
 AUTHENTICATION_BACKENDS = (
@@ -78,6 +82,13 @@ SITE_ID = 1
 ROOT_URLCONF = 'ucbc.urls'
 WSGI_APPLICATION = 'ucbc.wsgi.application'
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Shared by all the wsgi worker processes (see main.cache)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/var/tmp/ucbc_cache',
+    }
+}
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
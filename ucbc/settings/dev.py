@@ -15,6 +15,13 @@ TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 MIDDLEWARE_CLASSES += ('debug_toolbar.middleware.DebugToolbarMiddleware', )
 INTERNAL_IPS = ("127.0.0.1", "localhost")
 
+# Nothing is cached in dev (or between tests), every version stamp is new on each read
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',